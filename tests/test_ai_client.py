@@ -0,0 +1,73 @@
+import random
+import time
+import urllib.error
+
+import pytest
+
+from tooling.ai_client import ChatClient
+from tooling.stub_ai_server import StubHandler, serve
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**options):
+        server = serve(**options)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def client(url, **options):
+    return ChatClient("test-key", url=url, rate=0, **options)
+
+
+def test_rate_limited_requests_are_retried(stub):
+    random.seed(3)
+    chat = client(stub(fail_rate=0.5), concurrency=1, max_retries=20, backoff=5)
+    prompts = [f"Description: Store {i}, Main St" for i in range(20)]
+    assert chat.map(chat.complete, prompts) == [f"Store {i}" for i in range(20)]
+    assert chat.retries > 0
+    assert chat.errors == 0
+    assert StubHandler.requests == len(prompts) + chat.retries
+
+
+def test_retry_after_is_honoured(stub):
+    chat = client(stub(fail_rate=1.0, retry_after=0.2), max_retries=2, backoff=60)
+    start = time.perf_counter()
+    with pytest.raises(urllib.error.HTTPError):
+        chat.complete("Description: Store")
+    elapsed = time.perf_counter() - start
+    # Two waits of the server's 0.2s, not the client's own 60s backoff
+    assert 0.4 <= elapsed < 5
+
+
+def test_errors_count_requests_that_ran_out_of_retries(stub):
+    chat = client(stub(fail_rate=1.0), max_retries=2, backoff=0)
+    for _ in range(3):
+        with pytest.raises(urllib.error.HTTPError) as info:
+            chat.complete("Description: Store")
+        assert info.value.code == 429
+    assert (chat.calls, chat.retries, chat.errors) == (3, 6, 3)
+    assert StubHandler.requests == 9
+
+
+def test_read_timeouts_are_retried(stub):
+    chat = client(stub(latency=0.5), max_retries=1, backoff=0, timeout=0.1)
+    with pytest.raises(TimeoutError):
+        chat.complete("Description: Store")
+    assert (chat.retries, chat.errors) == (1, 1)
+
+
+def test_map_keeps_input_order_within_concurrency(stub):
+    chat = client(stub(latency=0.05), concurrency=3)
+    prompts = [f"Description: Store {i}" for i in range(12)]
+    random.seed(5)
+    random.shuffle(prompts)
+    assert chat.map(chat.complete, prompts) == [p.split(": ")[1] for p in prompts]
+    assert 1 < StubHandler.max_in_flight <= 3
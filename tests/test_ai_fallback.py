@@ -0,0 +1,31 @@
+import re
+
+from tooling.ai_fallback import apply_learned
+
+TAGS = [
+    {"name": "Chase Bank", "type": "Vendor", "regex": r"(?i)(INTRST|INTEREST)"},
+    {"name": "Uber", "type": "Vendor", "regex": "(?i)Uber"},
+    {"name": "Groceries", "type": "Market"},
+]
+LEARNED = [
+    {"name": "Chase Bank", "patterns": [r"CHASE\W+CREDIT"]},
+    {"name": "Uber", "patterns": [r"UBER\W+EATS"]},
+    {"name": "Lyft", "patterns": [r"LYFT\W+RIDE"], "related": []},
+]
+
+
+def regexes(tags):
+    return {tag["name"]: tag.get("regex") for tag in tags}
+
+
+def test_learned_patterns_extend_an_existing_regex():
+    chase = re.compile(regexes(apply_learned(TAGS, LEARNED))["Chase Bank"])
+    assert chase.search("MONTHLY INTRST PAID")
+    assert chase.search("chase credit crd autopay")
+
+
+def test_applying_learned_vendors_again_changes_nothing():
+    tags = apply_learned(TAGS, LEARNED)
+    assert apply_learned(tags, LEARNED) == tags
+    assert regexes(tags)["Uber"] == r"(?i)Uber|UBER\W+EATS"
+    assert [tag["name"] for tag in tags] == ["Chase Bank", "Uber", "Lyft", "Groceries"]
@@ -0,0 +1,19 @@
+import json
+
+from tooling import analyze
+
+TAGS = {"tags": [{"name": "Uber", "type": "Vendor", "related": ["Transport"]}, {"name": "Transport", "type": "Market"}]}
+
+
+def test_failed_xlsx_write_is_an_error(tmp_path, monkeypatch):
+    db = tmp_path / "db_tags.json"
+    db.write_text(json.dumps(TAGS))
+    monkeypatch.setattr(analyze, "write_xlsx", lambda rows, path: False)
+    assert analyze.analyze_tags(xlsx=str(tmp_path / "out.xlsx"), db_path=str(db)) == 1
+
+
+def test_csv_report(tmp_path, capsys):
+    db = tmp_path / "db_tags.json"
+    db.write_text(json.dumps(TAGS))
+    assert analyze.analyze_tags("csv", db_path=str(db)) == 0
+    assert capsys.readouterr().out == "Tag,Count\nTransport,1\n"
@@ -0,0 +1,137 @@
+import json
+import os
+
+import pytest
+
+from tooling import generate_tags_db
+from tooling.migrate_mock_tags import load_allowed_tags
+from tooling.stub_ai_server import stub_reply
+from tooling.tag_db import DEFAULT_DB_PATH, load_tag_db
+
+MCC_CSV = """mcc,edited_description,combined_description
+0742,Veterinary Services,Vet
+0763,Agricultural Co-operatives and Farm Stuff,Agri
+1520,General Contractors Residential and Commercial,Gen
+5411,Grocery Stores and Supermarkets,Groceries
+5942,Book Stores,Books
+"""
+
+
+class FakeClient:
+    """Stands in for ai_client.ChatClient, answering like the stub AI server."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.model = generate_tags_db.DEFAULT_MODEL
+        self.calls = self.retries = self.errors = 0
+        self.latencies = []
+        self.prompts = []
+
+    def complete(self, prompt, temperature=0.0, max_tokens=100):
+        self.calls += 1
+        self.prompts.append(prompt)
+        if self.fail:
+            self.errors += 1
+            raise RuntimeError("service unavailable")
+        return stub_reply(prompt)
+
+    def map(self, func, items):
+        return [func(item) for item in items]
+
+
+@pytest.fixture
+def base_dir(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / "tooling")
+    (tmp_path / "tooling" / "mcc_codes.csv").write_text(MCC_CSV)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("OPENAI_API_URL", raising=False)
+    return tmp_path
+
+
+def build(base_dir, monkeypatch, client=None, *args):
+    """One --offline generator run in `base_dir`; `client` None means no API key."""
+    if client is None:
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    else:
+        monkeypatch.setenv("OPENAI_API_KEY", "test")
+        monkeypatch.setattr(generate_tags_db, "ChatClient", lambda *a, **kw: client)
+    argv = ["--offline", "--base-dir", str(base_dir), *args]
+    return generate_tags_db.generate(generate_tags_db.parse_args(argv))
+
+
+def cached_values(base_dir):
+    path = base_dir / "tooling" / "ai_cache.jsonl"
+    if not path.exists():
+        return []
+    return [json.loads(line)["value"] for line in path.read_text().splitlines() if line.strip()]
+
+
+def test_failed_requests_are_not_cached(base_dir, monkeypatch):
+    client = FakeClient(fail=True)
+    build(base_dir, monkeypatch, client)
+    assert client.calls > 0
+    assert cached_values(base_dir) == []
+    # The heuristic still names the tags of this build
+    with open(base_dir / DEFAULT_DB_PATH) as f:
+        names = {tag["name"] for tag in json.load(f)["tags"]}
+    assert "General Contractors" in names
+
+
+def test_ai_answers_are_cached(base_dir, monkeypatch):
+    build(base_dir, monkeypatch, FakeClient())
+    assert "General Contractors" in cached_values(base_dir)
+
+
+def test_keyless_build_is_redone_once_a_key_is_set(base_dir, monkeypatch):
+    build(base_dir, monkeypatch)
+    client = FakeClient()
+    build(base_dir, monkeypatch, client, "--incremental")
+    # The heuristic names and the empty relations of the first build are not reused
+    assert client.calls > 0
+    assert "General Contractors" in cached_values(base_dir)
+
+
+def test_fallback_records_are_redone_by_the_next_incremental_build(base_dir, monkeypatch):
+    build(base_dir, monkeypatch, FakeClient(fail=True))
+    client = FakeClient()
+    build(base_dir, monkeypatch, client, "--incremental")
+    assert client.calls > 0
+    assert "General Contractors" in cached_values(base_dir)
+    # Once the AI has answered, a further incremental build reuses everything
+    again = FakeClient()
+    build(base_dir, monkeypatch, again, "--incremental")
+    assert again.calls == 0
+
+
+def test_prompt_change_misses_legacy_cache_entries(base_dir, monkeypatch):
+    (base_dir / "tooling" / "mcc_name_cache.json").write_text(json.dumps({"1520": "Legacy Contractors"}))
+    (base_dir / "tooling" / "tag_relations_cache.json").write_text(json.dumps({"Amazon": ["Shopping"]}))
+    client = FakeClient()
+    build(base_dir, monkeypatch, client)
+    # Under the prompts they were made with, the legacy answers are hits
+    assert not any("General Contractors Residential" in p for p in client.prompts)
+    assert not any("'Amazon'" in p for p in client.prompts)
+
+    monkeypatch.setattr(generate_tags_db, "SHORT_NAME_PROMPT", generate_tags_db.SHORT_NAME_PROMPT + " Be brief.")
+    monkeypatch.setattr(generate_tags_db, "RELATIONS_PROMPT", generate_tags_db.RELATIONS_PROMPT + " Be brief.")
+    client = FakeClient()
+    build(base_dir, monkeypatch, client)
+    assert any("General Contractors Residential" in p for p in client.prompts)
+    assert any("'Amazon'" in p for p in client.prompts)
+
+
+def test_local_relations_are_not_reused_as_ai_answers(base_dir, monkeypatch):
+    build(base_dir, monkeypatch, FakeClient())
+    # Without cached answers, every relation comes from the index over the last db_tags.json
+    os.remove(base_dir / "tooling" / "ai_cache.jsonl")
+    build(base_dir, monkeypatch, FakeClient(), "--local-relations", "--min-relations-confidence", "0")
+    client = FakeClient()
+    build(base_dir, monkeypatch, client, "--incremental")
+    assert any("'Amazon'" in prompt for prompt in client.prompts)
+
+
+def test_generate_writes_the_db_the_other_tools_read(base_dir, monkeypatch):
+    monkeypatch.chdir(base_dir)
+    generate_tags_db.generate(generate_tags_db.parse_args(["--offline"]))
+    assert "General Contractors" in load_tag_db(DEFAULT_DB_PATH, use_snapshot=False).names
+    assert load_allowed_tags()["General Contractors"] == "General Contractors"
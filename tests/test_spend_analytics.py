@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+from tooling.spend_analytics import SpendColumns, SpendReport
+
+RECORDS = [
+    {"date": "2025-01-01", "amount": 10, "tags": ["Dining", "Fast Food"]},
+    {"date": "2025-01-03", "amount": 5.5, "tags": ["Dining", "Fast Food"]},
+    {"date": "2025-01-20", "amount": 40, "tags": ["Dining"]},
+    {"date": "2025-02-02", "amount": 30, "category": ["Groceries"]},
+]
+
+
+def test_totals_and_counts_per_tag():
+    report = SpendReport(SpendColumns.from_records(RECORDS))
+    assert report.totals == {"Dining": 55.5, "Fast Food": 15.5, "Groceries": 30.0}
+    assert report.counts == {"Dining": 3, "Fast Food": 2, "Groceries": 1}
+
+
+def test_weekly_budget_windows():
+    report = SpendReport(SpendColumns.from_records(RECORDS), [("Dining", 35.0, 7)])
+    windows = {(w["start"], w["end"]): w for w in report.windows}
+    assert windows[("2025-01-01", "2025-01-07")]["spent"] == 15.5
+    # 31 days: the three-day remainder joins the last period, pro-rating its limit
+    assert windows[("2025-01-15", "2025-01-21")]["over"]
+    assert windows[("2025-01-22", "2025-01-31")]["limit"] == 50.0
+    assert report.windows[0]["over"]
+
+
+def test_numpy_and_stdlib_engines_agree():
+    pytest.importorskip("numpy")
+    rng = random.Random(7)
+    tag_sets = [["Dining"], ["Dining", "Fast Food"], ["Groceries"], [], ["Rent", "Fixed"]]
+    records = [{"date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "amount": round(rng.uniform(-50, 200), 2), "tags": rng.choice(tag_sets)} for _ in range(2000)]
+    cols = SpendColumns.from_records(records)
+    budgets = [("Dining", 150.0, 7), ("Groceries", 400.0, 0), ("Missing", 10.0, 14)]
+    stdlib = SpendReport(cols, budgets, use_numpy=False)
+    vectorised = SpendReport(cols, budgets, use_numpy=True)
+    assert (stdlib.engine, vectorised.engine) == ("python", "numpy")
+    assert vectorised.counts == stdlib.counts
+    assert vectorised.totals == pytest.approx(stdlib.totals)
+    assert [w["spent"] for w in vectorised.windows] == pytest.approx([w["spent"] for w in stdlib.windows], abs=0.011)
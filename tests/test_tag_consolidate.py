@@ -0,0 +1,37 @@
+import re
+
+from tooling.tag_consolidate import cluster_names, consolidate, merge_regex, one_edit_apart
+
+
+def test_insertions_and_deletions_are_one_edit():
+    assert one_edit_apart("drugstore", "drugstores")
+    assert one_edit_apart("homeimprovement", "homeimprovements")
+    assert not one_edit_apart("printing", "painting")
+    assert not one_edit_apart("printing", "printing")
+
+
+def test_substitutions_do_not_cluster():
+    names = ["Printing", "Painting", "Home Improvement", "Home Improvemnt"]
+    assert sorted(cluster_names(names)) == [[0], [1], [2, 3]]
+
+
+def test_consolidate_aliases_dropped_names():
+    tags = [{"name": "Fast Food", "type": "Market"}, {"name": "Fast-Food", "type": "Service"}]
+    merged_tags, aliases, merged = consolidate(tags)
+    assert [tag["name"] for tag in merged_tags] == ["Fast Food"]
+    assert aliases == {"Fast-Food": "Fast Food"}
+    assert merged == [(0, [1])]
+
+
+def test_merge_regex_keeps_shared_flags_in_front():
+    assert merge_regex("(?i)UBER", "(?i)UBER EATS") == "(?i)UBER|UBER EATS"
+
+
+def test_merge_regex_scopes_differing_flags():
+    merged = merge_regex("(?i)lyft", "UBER")
+    pattern = re.compile(merged)
+    assert pattern.fullmatch("LYFT")
+    assert pattern.fullmatch("UBER")
+    assert not pattern.fullmatch("uber")
+    # A merged regex merges again
+    assert re.compile(merge_regex(merged, "(?i)taxi")).fullmatch("Taxi")
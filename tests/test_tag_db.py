@@ -0,0 +1,50 @@
+import json
+
+from tooling.generate_tags_db import closure_section
+from tooling.tag_db import BinaryTagDB, binary_mismatches, to_binary, to_json
+
+TAGS = [
+    {"name": "Gifts", "type": "Market", "related": ["Books"]},
+    {"name": "Books", "type": "Market", "mcc_id": "5942", "mcc_ids": ["5942", "5192"]},
+]
+ALIASES = {"Gift": "Gifts", "Book Stores": "Books"}
+
+
+def test_binary_keeps_aliases():
+    db = BinaryTagDB(to_binary(TAGS, aliases=ALIASES))
+    assert db.aliases == ALIASES
+    assert binary_mismatches(TAGS, None, db, ALIASES) == []
+
+
+def test_binary_mismatches_reports_missing_aliases():
+    db = BinaryTagDB(to_binary(TAGS))
+    assert db.aliases == {}
+    assert binary_mismatches(TAGS, None, db, ALIASES) == ["aliases differ"]
+
+
+# Every shape of tag the generator writes: merged MCC codes, missing and null
+# fields, shared names, non-ASCII text and a related cycle for the closure
+FIXTURE_TAGS = [
+    {"name": "Uber", "type": "Vendor", "description": "Vendor: Uber", "regex": r"(?i)Uber|UBER\W+EATS",
+     "related": ["Transportation", "Fast Food"]},
+    {"name": "Fast Food", "type": "Market", "related": ["Restaurants"]},
+    {"name": "Restaurants", "type": "Market", "related": ["Fast Food"]},
+    {"name": "Transportation", "type": "Market"},
+    {"name": "Fast Food", "type": "Service", "mcc_id": "5814", "source": None, "related": []},
+    {"name": "Contractors", "type": "Service", "mcc_id": "1520", "mcc_ids": ["1520", "1711", "1731"],
+     "description": "Général contractors"},
+]
+FIXTURE_ALIASES = {"Contractor": "Contractors", "Fast-Food": "Fast Food", "Restaurant": "Restaurants"}
+
+
+def test_db_tags_bin_round_trips(tmp_path):
+    section = closure_section(FIXTURE_TAGS)
+    assert section["targets"]
+    (tmp_path / "db_tags.json").write_text(to_json(FIXTURE_TAGS, section, FIXTURE_ALIASES))
+    (tmp_path / "db_tags.bin").write_bytes(to_binary(FIXTURE_TAGS, section, FIXTURE_ALIASES))
+
+    data = json.loads((tmp_path / "db_tags.json").read_text())
+    with BinaryTagDB.open(str(tmp_path / "db_tags.bin")) as db:
+        assert binary_mismatches(data["tags"], data["related_closure"], db, data["aliases"]) == []
+        assert db.find("Fast Food") == [1, 4]
+        assert db.tag(5)["mcc_ids"] == ["1520", "1711", "1731"]
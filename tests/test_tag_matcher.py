@@ -0,0 +1,33 @@
+from tooling.tag_matcher import TagMatcher
+
+# Patterns as the app's AI service writes them back into db_tags.json: inner groups included
+NESTED = [
+    {"name": "Credit Card Payment", "type": "Vendor", "regex": "(?i)(PAYMENT.*THANK|CREDIT CARD)"},
+    {"name": "Chase Bank", "type": "Vendor", "regex": "(?i)(INTRST|INTEREST)"},
+    {"name": "Uber", "type": "Vendor", "regex": "(?i)Uber"},
+    {"name": "Lyft", "type": "Vendor", "regex": "(?i)(?P<ride>LYFT)\\s*(RIDE)?"},
+]
+
+
+def test_nested_groups_map_to_their_vendor():
+    matcher = TagMatcher(NESTED)
+    assert matcher.match_vendor("INTRST PYMNT") == "Chase Bank"
+    assert matcher.match_vendor("PAYMENT - THANK YOU") == "Credit Card Payment"
+    assert matcher.match_vendor("LYFT RIDE SAT 8PM") == "Lyft"
+    assert matcher.match_vendor("UBER 063015 SF**POOL**") == "Uber"
+    assert matcher.match_vendor("COMPTONS MARKET") is None
+
+
+def test_nested_groups_in_any_tag_order():
+    for tags in (NESTED, NESTED[::-1], NESTED[1:] + NESTED[:1]):
+        matcher = TagMatcher(tags)
+        assert matcher.match("INTRST PYMNT")[0] == "Chase Bank"
+        assert matcher.match("CREDIT CARD AUTOPAY")[0] == "Credit Card Payment"
+
+
+def test_mcc_match_without_vendor():
+    tags = NESTED + [{"name": "Fast Food", "type": "Service", "mcc_id": "5814", "related": ["Dining"]},
+                     {"name": "Dining", "type": "Market"}]
+    vendor, names = TagMatcher(tags).match("SOMEWHERE", mcc=5814)
+    assert vendor is None
+    assert names == ("Fast Food", "Dining")
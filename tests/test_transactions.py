@@ -0,0 +1,44 @@
+import json
+import tracemalloc
+
+import pytest
+
+from tooling.transactions import iter_json_array
+
+ITEMS = [{"id": i, "description": f"Store {i} é \\\" ", "amount": -12.5 * i, "pending": i % 2 == 0,
+          "tags": None} for i in range(200)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 16])
+def test_items_split_across_chunks(tmp_path, chunk_size):
+    path = tmp_path / "tx.json"
+    path.write_text(json.dumps(ITEMS))
+    assert list(iter_json_array(str(path), chunk_size)) == ITEMS
+
+
+def test_malformed_first_item_fails_without_reading_the_file(tmp_path):
+    path = tmp_path / "tx.json"
+    record = json.dumps({"id": 1, "description": "x" * 200})
+    path.write_text('[{"id": 0,, "amount": 1},' + ",".join([record] * 50_000) + "]")
+    tracemalloc.start()
+    try:
+        with pytest.raises(ValueError, match="invalid JSON array item"):
+            next(iter_json_array(str(path), chunk_size=1024))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < path.stat().st_size // 10
+
+
+def test_item_over_the_size_limit(tmp_path):
+    path = tmp_path / "tx.json"
+    path.write_text(json.dumps([{"description": "x" * 5000}]))
+    with pytest.raises(ValueError, match="over 1000 characters"):
+        list(iter_json_array(str(path), chunk_size=256, max_item_size=1000))
+
+
+def test_truncated_array(tmp_path):
+    path = tmp_path / "tx.json"
+    path.write_text(json.dumps(ITEMS)[:-40])
+    with pytest.raises(ValueError):
+        list(iter_json_array(str(path), chunk_size=64))
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from tooling.transactions import load_transactions
+from tooling.vendor_extract import VendorExtractor, accuracy
+
+HOLDOUT = os.path.join(os.path.dirname(__file__), "data", "vendor_holdout.yaml")
+
+
+@pytest.mark.parametrize("description", [
+    "CD DEPOSIT .INITIAL.", "MOBILE DEPOSIT REF 4419", "ATM CASH DEPOSIT 0412", "ATM DEP 06/02", "DEPOSIT ID 882134",
+])
+def test_bank_deposit_lines(description):
+    assert VendorExtractor().extract(description) == "Bank Deposit"
+
+
+@pytest.mark.parametrize("description, vendor", [
+    ("TEXAS DEPOSIT GRILL AUSTIN TX", "Texas Deposit Grill"),
+    ("POS DEBIT DEPOSIT WINE BAR 0423 BROOKLYN NY", "Deposit Wine Bar"),
+    ("Salary Deposit", "Salary Deposit"),
+])
+def test_merchants_named_deposit(description, vendor):
+    assert VendorExtractor().extract(description) == vendor
+
+
+def test_holdout_accuracy():
+    hits, misses = accuracy(VendorExtractor(), load_transactions(HOLDOUT))
+    # The rules alone, without the tag DB's vendor names (18 of 26 when written)
+    assert hits / (hits + len(misses)) >= 0.65
@@ -0,0 +1,23 @@
+import pytest
+
+from tooling.yaml_emitter import emit_tags, scalar, yaml_mismatches
+
+yaml = pytest.importorskip("yaml")
+
+
+@pytest.mark.parametrize("value", [
+    "Café", "AT&T", "yes", "0780", "=", "<<", "a: b", " padded",
+    "NEL\x85inside", "C1\x90control", "DEL\x7f", "line separator", "﻿BOM",
+])
+def test_scalars_read_back_as_the_same_string(value):
+    assert yaml.safe_load(f"k: {scalar(value)}")["k"] == value
+
+
+def test_special_keys_are_quoted():
+    assert scalar("=") == '"="'
+    assert scalar("<<") == '"<<"'
+
+
+def test_emitted_tags_read_back():
+    tags = [{"name": "Caf\x85e", "type": "Vendor", "regex": "(?i)Caf\x85e", "related": ["=", "<<"]}]
+    assert yaml_mismatches(emit_tags(tags), tags) == []
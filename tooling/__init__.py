@@ -0,0 +1,17 @@
+"""Tag DB tooling for Budgetizer: generation, migration, reports and matching.
+
+Importing the package or any of its modules does no work: paths come from
+arguments (defaults are relative to the working directory at call time),
+nothing touches the network or the disk until a function is called, and
+main() functions return exit codes instead of exiting. A long-lived process
+can therefore call them repeatedly; load_tag_db and TagMatcher.from_file
+keep what they parsed until the DB file changes.
+
+    budgetizer-tools generate | migrate | analyze | match ...
+    python -m tooling generate ...
+
+Modules use package-relative imports, so one with a command line of its own
+runs as `python -m tooling.<module>` from the repository root (e.g.
+`python -m tooling.tag_db` checks db_tags.bin); `python tooling/<module>.py`
+does not work.
+"""
@@ -0,0 +1,153 @@
+"""Concurrent, rate-limited client for the chat-completions endpoint.
+
+generate_tags_db.py uses this for the naming and cross-reference passes so
+a cold-cache rebuild is not ~1000 blocking round trips in a row.
+"""
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_API_URL = "https://api.openai.com/v1/chat/completions"
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# Statuses worth retrying: rate limited or a transient server failure.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ChatClient:
+    """Thread-safe wrapper around one chat-completions endpoint.
+
+    `url` can point at a local stub server (see stub_ai_server.py) so the
+    passes can be exercised without a real API key or network access.
+    """
+
+    def __init__(self, api_key, url=DEFAULT_API_URL, model=DEFAULT_MODEL,
+                 concurrency=8, rate=5.0, max_retries=5, backoff=0.5, timeout=30):
+        self.api_key = api_key
+        self.url = url
+        self.model = model
+        self.concurrency = max(1, int(concurrency))
+        self.bucket = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # Logical requests sent (retries not included), for pass reports
+        self.calls = 0
+        # HTTP attempts beyond the first, and requests that failed for good
+        self.retries = 0
+        self.errors = 0
+        # Seconds per logical request, retries and rate-limit waits included
+        self.latencies = []
+        self._calls_lock = threading.Lock()
+
+    def complete(self, prompt, temperature=0.0, max_tokens=100):
+        """Send one prompt and return the message content.
+
+        Retries with exponential backoff (honouring Retry-After) on 429/5xx,
+        connection errors and timeouts or resets while reading the reply;
+        re-raises the last error once retries run out.
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.api_key}"
+        }
+        with self._calls_lock:
+            self.calls += 1
+        data = json.dumps({
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }).encode("utf-8")
+
+        start = time.perf_counter()
+        failed = True
+        attempt = 0
+        try:
+            while True:
+                self.bucket.acquire()
+                try:
+                    req = urllib.request.Request(self.url, data=data, headers=headers)
+                    with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                        result = json.loads(response.read().decode())
+                        content = result["choices"][0]["message"]["content"].strip()
+                        failed = False
+                        return content
+                except urllib.error.HTTPError as e:
+                    if e.code not in RETRY_STATUSES or attempt >= self.max_retries:
+                        raise
+                    retry_after = self._retry_after(e)
+                    delay = retry_after if retry_after is not None else self._delay(attempt)
+                except (urllib.error.URLError, TimeoutError, ConnectionError):
+                    # urlopen wraps errors sending the request in URLError; a timeout or
+                    # reset waiting for or reading the reply comes through as is
+                    if attempt >= self.max_retries:
+                        raise
+                    delay = self._delay(attempt)
+                attempt += 1
+                time.sleep(delay)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._calls_lock:
+                self.latencies.append(elapsed)
+                self.retries += attempt
+                self.errors += failed
+
+    def map(self, func, items):
+        """Run `func(item)` over `items` on the worker pool.
+
+        Results come back in the same order as `items`, regardless of which
+        request finishes first, so the generated tag DB stays deterministic.
+        """
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(items))) as pool:
+            return list(pool.map(func, items))
+
+    def _delay(self, attempt):
+        return self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+
+    @staticmethod
+    def _retry_after(error):
+        value = error.headers.get("Retry-After") if error.headers else None
+        try:
+            return float(value) if value else None
+        except ValueError:
+            return None
+
+
+def chunked(items, size):
+    """Splits `items` into consecutive lists of at most `size` entries."""
+    items = list(items)
+    size = max(1, int(size))
+    return [items[i:i + size] for i in range(0, len(items), size)]
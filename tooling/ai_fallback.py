@@ -0,0 +1,254 @@
+"""Batched AI fallback for transactions the tag DB does not match.
+
+This is the AI half of the "lazy AI matching" in docs/tagging.md. Bank feeds
+repeat one unknown merchant thousands of times with store numbers, dates and
+locations mixed in ("Uber 063015 SF**POOL**", "Uber 072515 SF**POOL**"), so
+unmatched descriptions are first reduced to a merchant key: upper-cased,
+split on separators, cut at the first token holding a digit, and stripped
+of a trailing "CITY ST" (vendor_extract.merchant_tokens). The queue holds one entry per key.
+
+flush() then asks the AI once per key, in batches, with the generator's
+generate_short_names_batch / find_related_markets_batch. A key whose answer
+is an existing Vendor becomes an extra pattern on that vendor's regex; any
+other answer becomes a new Vendor tag. Learned vendors are saved to
+tooling/learned_vendors.json (which the generator merges on every build) and
+patched into db_tags.json/.yaml/.bin right away, so later occurrences match
+locally.
+
+    budgetizer-tools fallback sandbox_transactions.yaml --dry-run
+"""
+import argparse
+import os
+import re
+import sys
+from collections import Counter
+
+from .ai_client import ChatClient, DEFAULT_API_URL, chunked
+from .generate_tags_db import (MARKETS, BuildPaths, closure_section, find_related_markets_batch,
+                               generate_short_names_batch, get_api_key, read_env_setting,
+                               report_requests, write_if_changed)
+from .tag_consolidate import merge_regex, split_flags
+from .tag_db import (DEFAULT_DB_PATH, dump_learned_vendors, learned_vendor_tag, load_learned_vendors,
+                     load_tag_db, to_binary, to_json, to_yaml, vendor_regex)
+from .tag_matcher import TagMatcher
+from .transactions import description_of, load_transactions
+from .vendor_extract import merchant_tokens
+
+# Between the tokens of a learned pattern: whatever separated them in the description
+PATTERN_SEPARATOR = r"\W+"
+# How many raw descriptions each learned vendor keeps as examples
+EXAMPLE_LIMIT = 5
+
+
+def merchant_key(description):
+    """Normalised merchant for `description`; descriptions with the same key are one merchant."""
+    return " ".join(merchant_tokens(description))
+
+
+def key_pattern(key):
+    """A regex body matching the merchant key inside raw descriptions, ignoring the separators."""
+    return PATTERN_SEPARATOR.join(re.escape(token) for token in key.split())
+
+
+class FallbackQueue:
+    """Unmatched descriptions, collapsed to one entry per merchant key.
+
+    add() and add_batch() skip anything `matcher` tags locally. The queue
+    only counts; nothing is sent until flush().
+    """
+
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.examples = {}  # key -> Counter of raw descriptions
+        self.seen = 0
+        self.matched = 0
+        self.skipped = Counter()  # descriptions with no merchant left after normalising
+
+    def add(self, description, mcc=None):
+        self.seen += 1
+        if self.matcher.match(description, mcc)[1]:
+            self.matched += 1
+        else:
+            self._queue(description)
+
+    def add_batch(self, transactions):
+        _, misses = self.matcher.match_batch(transactions)
+        self.seen += len(transactions)
+        self.matched += len(transactions) - len(misses)
+        for i in misses:
+            self._queue(description_of(transactions[i]))
+
+    def _queue(self, description):
+        key = merchant_key(description)
+        if key:
+            self.examples.setdefault(key, Counter())[description] += 1
+        else:
+            self.skipped[description] += 1
+
+    def __len__(self):
+        return len(self.examples)
+
+    @property
+    def queued(self):
+        return sum(sum(c.values()) for c in self.examples.values())
+
+    def flush(self, tags, client, batch_size=20, market_names=None):
+        """Asks the AI about every queued key; returns the learned vendors.
+
+        Each result is {"name", "patterns", "related", "examples"}; `related`
+        is only filled in for names that are not Vendor tags yet. Two AI
+        passes are made, each batched: names for the keys, then markets for
+        the new names. The queue is empty afterwards.
+        """
+        market_names = market_names or [m["name"] for m in MARKETS]
+        keys = list(self.examples)
+        # The most frequent raw form is the most representative one to show the AI
+        items = [(key, self.examples[key].most_common(1)[0][0]) for key in keys]
+        named = {}
+        for batch in client.map(lambda batch: generate_short_names_batch(batch, client),
+                                list(chunked(items, batch_size))):
+            named.update(batch)
+
+        vendors = {tag["name"].casefold(): tag for tag in tags if tag.get("type") == "Vendor"}
+        learned = {}
+        for key in keys:
+            name = (named.get(key) or "").strip()
+            if not name:
+                continue
+            existing = vendors.get(name.casefold())
+            name = existing["name"] if existing else name
+            entry = learned.setdefault(name, {"name": name, "patterns": [], "related": [], "examples": []})
+            entry["patterns"].append(key_pattern(key))
+            entry["examples"].extend(d for d, _ in self.examples[key].most_common(EXAMPLE_LIMIT))
+            del entry["examples"][EXAMPLE_LIMIT:]
+
+        new = [entry for name, entry in learned.items() if name.casefold() not in vendors]
+        if new:
+            payload = [(e["name"], f"Vendor seen in bank transactions as: {'; '.join(e['examples'])}") for e in new]
+            relations = {}
+            for batch in client.map(lambda batch: find_related_markets_batch(batch, market_names, client),
+                                    list(chunked(payload, batch_size))):
+                relations.update(batch)
+            for entry in new:
+                entry["related"] = [r for r in (relations.get(entry["name"]) or []) if r in market_names]
+
+        self.examples = {}
+        return list(learned.values())
+
+
+def merge_learned(saved, learned):
+    """`saved` learned vendors plus `learned`, patterns and examples merged by name."""
+    merged = {entry["name"]: dict(entry) for entry in saved}
+    for entry in learned:
+        current = merged.get(entry["name"])
+        if current is None:
+            merged[entry["name"]] = entry
+            continue
+        current["patterns"] = list(dict.fromkeys(current.get("patterns", []) + entry["patterns"]))
+        current["examples"] = list(dict.fromkeys(current.get("examples", []) + entry["examples"]))[:EXAMPLE_LIMIT]
+        current["related"] = current.get("related") or entry["related"]
+    return list(merged.values())
+
+
+def learned_regex(tag, patterns):
+    """`tag`'s regex with the learned `patterns` it does not have yet added.
+
+    A regex that is just the vendor name is rebuilt the way the generator
+    builds it; any other (hand-written or merged) regex keeps its alternatives.
+    """
+    regex = tag.get("regex")
+    if not regex or regex == vendor_regex(tag["name"]):
+        return vendor_regex(tag["name"], patterns)
+    # Learned patterns never contain "|", so a top-level split finds the ones already in
+    present = set(split_flags(regex)[1].split("|"))
+    missing = [p for p in patterns if p not in present]
+    return merge_regex(regex, "(?i)" + "|".join(missing)) if missing else regex
+
+
+def apply_learned(tags, learned):
+    """A copy of `tags` with the learned vendors in: patterns are added to the
+    regex of existing Vendor tags, new vendors go after the last Vendor tag
+    (where the generator puts them)."""
+    tags = [dict(tag) for tag in tags]
+    by_name = {tag["name"]: tag for tag in tags if tag.get("type") == "Vendor"}
+    insert_at = max((i + 1 for i, tag in enumerate(tags) if tag.get("type") == "Vendor"), default=0)
+    new_tags = []
+    for entry in learned:
+        tag = by_name.get(entry["name"])
+        if tag is None:
+            new_tags.append(learned_vendor_tag(entry))
+        else:
+            tag["regex"] = learned_regex(tag, entry["patterns"])
+    tags[insert_at:insert_at] = new_tags
+    return tags
+
+
+def write_tag_db(json_path, tags, aliases=None):
+    """Rewrites db_tags.json and its .yaml/.bin siblings for `tags`; returns the paths written."""
+    section = closure_section(tags)
+    base = os.path.splitext(json_path)[0]
+    outputs = [(json_path, to_json(tags, section, aliases)), (base + ".yaml", to_yaml(tags)),
+               (base + ".bin", to_binary(tags, section, aliases))]
+    return [path for path, content in outputs if write_if_changed(path, content)]
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Ask the AI about transactions the tag DB does not match")
+    parser.add_argument("transactions", help="Transactions file (.json or .yaml)")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to db_tags.json")
+    parser.add_argument("--base-dir", default=".",
+                        help="Directory holding tooling/learned_vendors.json and .env (default: current directory)")
+    parser.add_argument("--batch-size", type=int, default=20, help="Merchants per AI request (default: 20)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max in-flight AI requests")
+    parser.add_argument("--rate", type=float, default=5.0, help="Max AI requests per second (0 = unlimited)")
+    parser.add_argument("--dry-run", action="store_true", help="Only show the queue; no AI requests, nothing written")
+    args = parser.parse_args(argv)
+    paths = BuildPaths(args.base_dir)
+
+    try:
+        db = load_tag_db(args.db)
+    except FileNotFoundError:
+        print(f"Error: File not found at {args.db}")
+        return 1
+    queue = FallbackQueue(TagMatcher.from_file(args.db))
+    queue.add_batch(load_transactions(args.transactions))
+
+    print(f"{queue.seen} transactions: {queue.matched} matched locally, {queue.queued} unmatched "
+          f"-> {len(queue)} distinct merchants")
+    for key, descriptions in sorted(queue.examples.items(), key=lambda item: -sum(item[1].values())):
+        print(f" - {key!r}: {sum(descriptions.values())} ({len(descriptions)} distinct descriptions)")
+    if queue.skipped:
+        print(f"No merchant left after normalising {sum(queue.skipped.values())} descriptions: "
+              f"{', '.join(map(repr, queue.skipped))}")
+    if not queue or args.dry_run:
+        return 0
+
+    api_key = get_api_key(paths.env)
+    if not api_key:
+        print("No OpenAI API Key found; nothing learned (use --dry-run to just see the queue).")
+        return 1
+    client = ChatClient(api_key, url=read_env_setting("OPENAI_API_URL", paths.env) or DEFAULT_API_URL,
+                        concurrency=args.concurrency, rate=args.rate)
+    merchants = len(queue)
+    learned = queue.flush(db.tags, client, max(1, args.batch_size))
+    report_requests("AI fallback", merchants, client.calls)
+    for entry in learned:
+        print(f"Learned: {entry['name']!r} <- {', '.join(entry['patterns'])}"
+              + (f" (related: {', '.join(entry['related'])})" if entry["related"] else ""))
+
+    saved = merge_learned(load_learned_vendors(paths.learned_vendors), learned)
+    os.makedirs(os.path.dirname(paths.learned_vendors), exist_ok=True)
+    write_if_changed(paths.learned_vendors, dump_learned_vendors(saved))
+    print(f"Saved {len(saved)} learned vendors to {paths.learned_vendors}")
+    for path in write_tag_db(os.path.abspath(args.db), apply_learned(db.tags, saved), db.aliases):
+        print(f"Updated {path}")
+
+    # The DB changed on disk, so from_file builds a fresh matcher
+    recheck = FallbackQueue(TagMatcher.from_file(args.db))
+    recheck.add_batch(load_transactions(args.transactions))
+    print(f"Now matched locally: {recheck.matched} of {recheck.seen} transactions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
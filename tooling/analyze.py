@@ -0,0 +1,129 @@
+"""Tag DB reports: how often each tag is related to a Vendor, or the full inventory.
+
+    budgetizer-tools analyze --format csv -o docs/related.csv
+    budgetizer-tools analyze --inventory
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from collections import Counter
+
+from .tag_db import DEFAULT_DB_PATH, load_tag_db
+from .tag_inventory import Inventory
+
+# Define paths
+FILE_PATH = DEFAULT_DB_PATH
+OUTPUT_PATH = 'docs/inventory.xlsx'
+
+def count_related(db):
+    """Counter of how many Vendor entries list each tag in `related`."""
+    tag_counts = Counter()
+    # We only care about Vendor entries as per requirement
+    for entry in db.by_type.get('Vendor', []):
+        tag_counts.update(entry.get('related', []))
+    return tag_counts
+
+def to_csv(rows):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["Tag", "Count"])
+    writer.writerows(rows)
+    return out.getvalue()
+
+def to_json(rows):
+    return json.dumps([{"Tag": tag, "Count": count} for tag, count in rows], indent=2) + "\n"
+
+def to_markdown(rows):
+    lines = ["| Tag | Count |", "| --- | ---: |"]
+    lines.extend("| " + tag.replace("|", "\\|") + f" | {count} |" for tag, count in rows)
+    return "\n".join(lines) + "\n"
+
+FORMATTERS = {"csv": to_csv, "json": to_json, "md": to_markdown}
+
+def inventory_text(db, fmt):
+    """The full inventory report; as CSV, the sparse co-occurrence matrix."""
+    inventory = Inventory(db.tags)
+    if fmt == "json":
+        return json.dumps(inventory.to_dict(), indent=2) + "\n"
+    if fmt == "md":
+        return inventory.to_markdown()
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(["Tag", "Tag", "Count"])
+    writer.writerows((a, b, c) for (a, b), c in inventory.cooccurrence.most_common())
+    return out.getvalue()
+
+def write_xlsx(rows, path):
+    """Writes the rows as an Excel sheet; returns False if it could not."""
+    # pandas (and its Excel writer) take longer to import than the whole report
+    # takes to build, so they are only loaded when a spreadsheet is asked for
+    try:
+        import pandas as pd
+    except ImportError as e:
+        print(f"Error: --xlsx needs pandas and openpyxl ({e})")
+        return False
+
+    df = pd.DataFrame(rows, columns=['Tag', 'Count'])
+
+    # Ensure output directory exists
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # Write to Excel
+    try:
+        df.to_excel(path, index=False)
+        print(f"Successfully wrote {len(df)} tags to {path}")
+        print(df.head())
+    except Exception as e:
+        print(f"Error writing to Excel: {e}")
+        return False
+    return True
+
+def analyze_tags(fmt="md", output=None, xlsx=None, inventory=False, db_path=FILE_PATH):
+    """Writes the report to `output` (stdout if None); returns an exit code."""
+    # Load JSON data
+    try:
+        db = load_tag_db(db_path)
+    except FileNotFoundError:
+        print(f"Error: File not found at {db_path}")
+        return 1
+
+    if inventory:
+        text = inventory_text(db, fmt)
+    else:
+        # Sort by Count in descending order (ties keep first-seen order)
+        rows = count_related(db).most_common()
+        if xlsx:
+            if not write_xlsx(rows, xlsx):
+                return 1
+            if output is None:
+                return 0
+        text = FORMATTERS[fmt](rows)
+
+    if output is None:
+        sys.stdout.write(text)
+    else:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        print(f"Successfully wrote {'the tag inventory' if inventory else f'{len(rows)} tags'} to {output}")
+    return 0
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Count how often each tag is related to a Vendor tag")
+    parser.add_argument("--format", choices=sorted(FORMATTERS), default="md",
+                        help="Report format (default: md)")
+    parser.add_argument("-o", "--output", help="Write the report here instead of stdout")
+    parser.add_argument("--xlsx", nargs="?", const=OUTPUT_PATH,
+                        help=f"Also write an Excel sheet (needs pandas + openpyxl; default path {OUTPUT_PATH})")
+    parser.add_argument("--inventory", action="store_true",
+                        help="Report counts by type and source, related co-occurrence, orphans, "
+                             "dangling related names and duplicate names instead")
+    parser.add_argument("--db", default=FILE_PATH, help=f"Path to db_tags.json (default: {FILE_PATH})")
+    args = parser.parse_args(argv)
+    return analyze_tags(args.format, args.output, args.xlsx, args.inventory, args.db)
+
+if __name__ == "__main__":
+    sys.exit(main())
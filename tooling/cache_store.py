@@ -0,0 +1,152 @@
+"""Append-only, content-addressed cache for AI answers.
+
+Replaces the whole-file mcc_name_cache.json / tag_relations_cache.json
+rewrites. Every answer is appended to a JSON Lines log as soon as it arrives,
+so a crash mid-pass keeps everything computed so far (at worst the last line
+is torn, and it is skipped on load).
+
+Keys hash the prompt template, the model name and the prompt inputs, so
+editing a prompt only invalidates the entries built from it.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+
+def cache_key(template, model, *inputs):
+    raw = json.dumps([template, model, list(inputs)], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def load_legacy_cache(path):
+    """Reads one of the old flat JSON caches, or {} if it is missing/unreadable."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read legacy cache {path}: {e}")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class CacheStore:
+    """Key/value log with optional expiry.
+
+    `ttl` is in seconds; None keeps entries forever. Expired entries read as
+    misses and are dropped by compact(). Safe to share between the worker
+    threads of ai_client.ChatClient.
+    """
+
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.hits = Counter()
+        self.misses = Counter()
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    self.entries[record["key"]] = record
+                except (ValueError, KeyError, TypeError):
+                    print(f"Warning: skipping corrupt cache line {line_no} in {self.path}")
+
+    def _expired(self, record, now=None):
+        if self.ttl is None:
+            return False
+        return (now or time.time()) - record.get("created", 0) > self.ttl
+
+    def get(self, key, ns="default"):
+        """Returns the cached value, or None on a miss (absent or expired)."""
+        with self._lock:
+            record = self.entries.get(key)
+            if record is None or self._expired(record):
+                self.misses[ns] += 1
+                return None
+            self.hits[ns] += 1
+            return record["value"]
+
+    def put(self, key, value, ns="default", source=None, created=None):
+        record = {"key": key, "ns": ns, "value": value, "created": created or time.time()}
+        if source is not None:
+            # Keep the input next to the answer so the log stays greppable
+            record["input"] = source
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self.entries[key] = record
+            self.writes += 1
+
+    def import_legacy(self, key, value, ns, source=None, created=None):
+        """Adds an entry from an old JSON cache unless the key is already live."""
+        record = {"created": created or time.time()}
+        if self._expired(record):
+            return False
+        with self._lock:
+            existing = self.entries.get(key)
+            if existing is not None and not self._expired(existing):
+                return False
+        self.put(key, value, ns, source, created)
+        return True
+
+    def compact(self):
+        """Rewrites the log without expired or superseded entries.
+
+        Writes to a temp file and renames it over the log, so an interrupted
+        compaction leaves the previous log intact. Returns entries dropped.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            now = time.time()
+            live = {k: r for k, r in self.entries.items() if not self._expired(r, now)}
+            total_lines = 0
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    total_lines = sum(1 for line in f if line.strip())
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in live.values():
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.entries = live
+            return total_lines - len(live)
+
+    def stats(self):
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        return {ns: {"hits": self.hits[ns], "misses": self.misses[ns]} for ns in namespaces}
+
+    def report(self):
+        for ns, counts in self.stats().items():
+            lookups = counts["hits"] + counts["misses"]
+            ratio = counts["hits"] / lookups if lookups else 0.0
+            print(f"Cache '{ns}': {counts['hits']} hits, {counts['misses']} misses ({ratio:.0%} hit ratio)")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,53 @@
+"""The budgetizer-tools command: one subcommand per tool.
+
+    budgetizer-tools generate [--offline] [--incremental] [--base-dir DIR]
+    budgetizer-tools migrate [PATH] [--db PATH] [--workers N]
+    budgetizer-tools analyze [--inventory] [--format md|csv|json] [--db PATH]
+    budgetizer-tools match TRANSACTIONS [--db PATH]
+    budgetizer-tools fallback TRANSACTIONS [--db PATH] [--batch-size N] [--dry-run]
+    budgetizer-tools vendors [DESCRIPTION ...] [--accuracy TRANSACTIONS] [--bench ROWS]
+    budgetizer-tools spend TRANSACTIONS [--budget TAG=LIMIT[/DAYS] ...] [--json]
+    budgetizer-tools watch [--report PATH] [--once] [generator options]
+
+A subcommand's module is only imported when it runs, so `match` does not
+pay for the generator's imports. Each module's main(argv, prog) parses the
+rest of the command line and returns the exit code.
+"""
+import argparse
+import importlib
+import sys
+
+COMMANDS = {
+    "generate": ("generate_tags_db", "Generate db_tags.yaml / .json / .bin from the MCC list"),
+    "migrate": ("migrate_mock_tags", "Rewrite transaction categories to canonical db_tags names"),
+    "analyze": ("analyze", "Related-tag counts or the full tag inventory"),
+    "match": ("tag_matcher", "Tag transactions from db_tags.json"),
+    "fallback": ("ai_fallback", "Ask the AI once per unknown merchant and learn vendor patterns"),
+    "vendors": ("vendor_extract", "Extract vendor names from raw bank descriptions"),
+    "spend": ("spend_analytics", "Per-tag spend totals and budget windows"),
+    "watch": ("watch", "Regenerate and re-check the tag DB whenever its sources change"),
+}
+
+
+def run_command(command, argv=()):
+    """Runs one subcommand in this process; returns its exit code."""
+    module_name, _ = COMMANDS[command]
+    module = importlib.import_module(f".{module_name}", __package__)
+    return module.main(list(argv), prog=f"budgetizer-tools {command}") or 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="budgetizer-tools",
+        description="Budgetizer tag DB tooling",
+        epilog="\n".join(f"  {name:<10}{help_text}" for name, (_, help_text) in COMMANDS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("command", choices=COMMANDS, metavar="command", help=", ".join(COMMANDS))
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Options for the command (see COMMAND --help)")
+    args = parser.parse_args(argv)
+    return run_command(args.command, args.args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,28 @@
-import csv
-import urllib.request
+"""Generates db_tags.yaml / .json / .bin from the predefined tags and the MCC list.
+
+    budgetizer-tools generate [--offline] [--incremental] [--base-dir DIR]
+    python -m tooling.generate_tags_db ...    # the same
+"""
+import argparse
+import cProfile
+import hashlib
+import pstats
+import urllib.error
 import os
 import json
 import re
+import sys
+
+from .ai_client import ChatClient, DEFAULT_API_URL, DEFAULT_MODEL, chunked
+from .cache_store import CacheStore, cache_key, load_legacy_cache
+from .mcc_source import iter_mcc_rows, load_meta, refresh_snapshot
+from .related_index import DEFAULT_MIN_CONFIDENCE, RelatedIndex, tag_text
+from .run_metrics import RunMetrics, latency_histogram
+from .tag_consolidate import consolidate
+from .tag_db import (DEFAULT_DB_DIR, BinaryTagDB, binary_mismatches, learned_vendor_tag, load_learned_vendors,
+                     load_tag_db, to_binary, to_json, to_yaml, vendor_regex)
+from .tag_graph import related_closure
+from .yaml_emitter import yaml_mismatches
 
 # 1. Predefined Tags from all_tags.md
 VENDORS = [
@@ -119,349 +139,969 @@ def shorten_name(name):
     return candidate
 
 # AI & Caching Logic
-CACHE_FILE = os.path.join(os.getcwd(), "tooling", "mcc_name_cache.json")
-RELATIONS_CACHE_FILE = os.path.join(os.getcwd(), "tooling", "tag_relations_cache.json")
+# File locations are relative to the build's base directory (see BuildPaths)
+CACHE_STORE_FILE = os.path.join("tooling", "ai_cache.jsonl")
+# Pre-store flat JSON caches; imported into CACHE_STORE_FILE automatically
+CACHE_FILE = os.path.join("tooling", "mcc_name_cache.json")
+RELATIONS_CACHE_FILE = os.path.join("tooling", "tag_relations_cache.json")
 ENV_FILE = ".env"
+# Fingerprints of the source records behind the last build (see --incremental)
+STATE_FILE = os.path.join("tooling", "db_tags_state.json")
+# Vendor patterns learned from unmatched transactions (written by ai_fallback.py)
+LEARNED_VENDORS_FILE = os.path.join("tooling", "learned_vendors.json")
+# db_tags.yaml / .json / .bin go here (under --base-dir) unless --output-dir says otherwise
+OUTPUT_DIR = DEFAULT_DB_DIR
 
-def load_cache():
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, "r") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+# Prompt templates. Cache keys hash these, so editing one re-asks only its pass.
+SHORT_NAME_PROMPT = "Extract the specific BUSINESS NAME from this description if present. If it is a generic category, return a concise 1-2 word tag name. No punctuation. Examples: 'Stationery, Office Supplies' -> 'Stationery'. 'Holiday Inns, Holiday Inn Express' -> 'Holiday Inn'. Description: {description}"
+
+RELATIONS_PROMPT = (
+    "1. Identify the entity '{tag_name}' ({tag_desc}). What does it do? (e.g. 'It is a budget hotel'). "
+    "Does it offer secondary services (e.g. Pharmacy in a grocery store, Fast Food in a gas station)? "
+    "2. Based on that identification, select related Markets from {candidates}. "
+    "Return a valid JSON object: {{ 'identity': 'string', 'related': ['Tag1', 'Tag2'] }}. "
+    "If none apply, return {{ 'identity': '...', 'related': [] }}."
+)
+
+# The prompts the old mcc_name_cache.json / tag_relations_cache.json answers were
+# made with. Frozen copies: legacy entries are imported under keys built from
+# these, so once the prompts above change they no longer hit.
+LEGACY_SHORT_NAME_PROMPT = "Extract the specific BUSINESS NAME from this description if present. If it is a generic category, return a concise 1-2 word tag name. No punctuation. Examples: 'Stationery, Office Supplies' -> 'Stationery'. 'Holiday Inns, Holiday Inn Express' -> 'Holiday Inn'. Description: {description}"
 
-def save_cache(cache, filepath=CACHE_FILE):
+LEGACY_RELATIONS_PROMPT = (
+    "1. Identify the entity '{tag_name}' ({tag_desc}). What does it do? (e.g. 'It is a budget hotel'). "
+    "Does it offer secondary services (e.g. Pharmacy in a grocery store, Fast Food in a gas station)? "
+    "2. Based on that identification, select related Markets from {candidates}. "
+    "Return a valid JSON object: {{ 'identity': 'string', 'related': ['Tag1', 'Tag2'] }}. "
+    "If none apply, return {{ 'identity': '...', 'related': [] }}."
+)
+
+def fingerprint(*parts):
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+def load_state(path):
+    if not os.path.exists(path):
+        return {"records": {}}
     try:
-        with open(filepath, "w") as f:
-            json.dump(cache, f, indent=2)
-    except Exception as e:
-        print(f"Warning: Could not save cache: {e}")
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read build state {path}: {e}")
+        return {"records": {}}
 
-def load_relations_cache():
-    if os.path.exists(RELATIONS_CACHE_FILE):
-        try:
-            with open(RELATIONS_CACHE_FILE, "r") as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+def file_has(path, content):
+    # True when `path` already holds exactly `content`
+    mode = "b" if isinstance(content, bytes) else ""
+    try:
+        with open(path, "r" + mode) as f:
+            return f.read() == content
+    except OSError:
+        return False
+
+def write_if_changed(path, content):
+    # Leaves the file (and its mtime) alone when the bytes would not change
+    if file_has(path, content):
+        return False
+    mode = "b" if isinstance(content, bytes) else ""
+    with open(path, "w" + mode) as f:
+        f.write(content)
+    return True
 
-def get_api_key():
+def read_env_setting(name, env_file=ENV_FILE):
+    # Environment wins over .env so a stub endpoint can be swapped in per run
+    if os.environ.get(name):
+        return os.environ[name]
     try:
-        with open(ENV_FILE, "r") as f:
+        with open(env_file, "r") as f:
             for line in f:
-                if line.startswith("OPENAI_API_KEY="):
+                if line.startswith(f"{name}="):
                     return line.strip().split("=", 1)[1].strip('"')
-    except:
+    except OSError:
         return None
     return None
 
-def generate_short_name(description, api_key):
-    if not api_key:
+def get_api_key(env_file=ENV_FILE):
+    return read_env_setting("OPENAI_API_KEY", env_file)
+
+def generate_short_name(description, client):
+    # None when the request fails: the caller falls back to shorten_name, and
+    # the fallback must not be cached as if the AI had said it
+    if not client:
         return shorten_name(description) # Fallback to heuristic
 
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    
     # Prompt tuned: Extract specific BUSINESS NAME, otherwise category.
-    prompt = f"Extract the specific BUSINESS NAME from this description if present. If it is a generic category, return a concise 1-2 word tag name. No punctuation. Examples: 'Stationery, Office Supplies' -> 'Stationery'. 'Holiday Inns, Holiday Inn Express' -> 'Holiday Inn'. Description: {description}"
-    
-    data = json.dumps({
-        "model": "gpt-4o-mini",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.3,
-        "max_tokens": 10
-    }).encode("utf-8")
+    prompt = SHORT_NAME_PROMPT.format(description=description)
 
     try:
-        req = urllib.request.Request(url, data=data, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode())
-            candidate = result["choices"][0]["message"]["content"].strip()
-            # Clean up result just in case
-            return clean_text(candidate).replace(".", "")
+        candidate = client.complete(prompt, temperature=0.3, max_tokens=10)
+        # Clean up result just in case
+        return clean_text(candidate).replace(".", "")
     except Exception as e:
         print(f"AI Error for '{description}': {e}")
-        return shorten_name(description) # Fallback
+        return None
 
-def find_related_markets(tag_name, tag_desc, candidates, api_key):
-    if not api_key:
+def find_related_markets(tag_name, tag_desc, candidates, client):
+    # None when the request fails or the reply holds no JSON object (see generate_short_name)
+    if not client:
         return []
 
-    url = "https://api.openai.com/v1/chat/completions"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-    
     # Prompt: CoT, Identify first, then tag.
+    prompt = RELATIONS_PROMPT.format(tag_name=tag_name, tag_desc=tag_desc, candidates=candidates)
+
+    try:
+        content = client.complete(prompt, temperature=0.0, max_tokens=100)
+        # Try to parse JSON object
+        match = re.search(r'\{.*\}', content, re.DOTALL)
+        if match:
+            parsed = json.loads(match.group(0))
+            return parsed.get("related", [])
+        return None
+    except Exception as e:
+        print(f"AI Relation Error for '{tag_name}': {e}")
+        return None
+
+def parse_batch_response(content, key_field, requested):
+    # Pull the JSON array out of the reply and index it by `key_field`.
+    # Entries for keys we did not ask about are dropped; missing keys are left
+    # for the caller to retry per item.
+    match = re.search(r'\[.*\]', content, re.DOTALL)
+    if not match:
+        return {}
+    try:
+        parsed = json.loads(match.group(0))
+    except ValueError:
+        return {}
+    results = {}
+    for entry in parsed if isinstance(parsed, list) else []:
+        if isinstance(entry, dict) and str(entry.get(key_field)) in requested:
+            results[str(entry[key_field])] = entry
+    return results
+
+def generate_short_names_batch(items, client):
+    # items: [(mcc_id, description)] -> {mcc_id: short name}
+    if not client:
+        return {mcc_id: shorten_name(desc) for mcc_id, desc in items}
+
+    payload = json.dumps([{"mcc_id": mcc_id, "description": desc} for mcc_id, desc in items])
     prompt = (
-        f"1. Identify the entity '{tag_name}' ({tag_desc}). What does it do? (e.g. 'It is a budget hotel'). "
-        "Does it offer secondary services (e.g. Pharmacy in a grocery store, Fast Food in a gas station)? "
+        "For each item, extract the specific BUSINESS NAME from its description if present. "
+        "If it is a generic category, return a concise 1-2 word tag name. No punctuation. "
+        "Examples: 'Stationery, Office Supplies' -> 'Stationery'. 'Holiday Inns, Holiday Inn Express' -> 'Holiday Inn'. "
+        'Return ONLY a JSON array with one object per item: [{"mcc_id": "...", "name": "..."}]. '
+        f"Items: {payload}"
+    )
+
+    parsed = {}
+    try:
+        content = client.complete(prompt, temperature=0.3, max_tokens=20 + 15 * len(items))
+        parsed = parse_batch_response(content, "mcc_id", {mcc_id for mcc_id, _ in items})
+    except Exception as e:
+        print(f"AI Batch Error ({len(items)} descriptions): {e}")
+
+    names = {}
+    for mcc_id, desc in items:
+        name = parsed.get(mcc_id, {}).get("name")
+        if isinstance(name, str) and name.strip():
+            names[mcc_id] = clean_text(name.strip()).replace(".", "")
+        else:
+            # Partial/malformed batch: ask for this one on its own
+            names[mcc_id] = generate_short_name(desc, client)
+    return names
+
+def find_related_markets_batch(tags, candidates, client):
+    # tags: [(name, description)] -> {name: [related markets]}
+    if not client:
+        return {name: [] for name, _ in tags}
+
+    payload = json.dumps([{"tag": name, "description": desc} for name, desc in tags])
+    prompt = (
+        "For each entity below: 1. Identify what it does (e.g. 'It is a budget hotel') and whether it "
+        "offers secondary services (e.g. Pharmacy in a grocery store, Fast Food in a gas station). "
         f"2. Based on that identification, select related Markets from {candidates}. "
-        f"Return a valid JSON object: {{ 'identity': 'string', 'related': ['Tag1', 'Tag2'] }}. "
-        f"If none apply, return {{ 'identity': '...', 'related': [] }}."
+        'Return ONLY a JSON array with one object per entity: [{"tag": "...", "identity": "...", "related": ["Tag1"]}]. '
+        f"Use an empty related list if none apply. Entities: {payload}"
     )
-    
-    data = json.dumps({
-        "model": "gpt-4o-mini",
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": 0.0,
-        "max_tokens": 100
-    }).encode("utf-8")
 
+    parsed = {}
     try:
-        req = urllib.request.Request(url, data=data, headers=headers)
-        with urllib.request.urlopen(req) as response:
-            result = json.loads(response.read().decode())
-            content = result["choices"][0]["message"]["content"].strip()
-            # Try to parse JSON object
-            match = re.search(r'\{.*\}', content, re.DOTALL)
-            if match:
-                parsed = json.loads(match.group(0))
-                return parsed.get("related", [])
-            return []
+        content = client.complete(prompt, temperature=0.0, max_tokens=20 + 60 * len(tags))
+        parsed = parse_batch_response(content, "tag", {name for name, _ in tags})
     except Exception as e:
-        print(f"AI Relation Error for '{tag_name}': {e}")
-        return []
+        print(f"AI Batch Relation Error ({len(tags)} tags): {e}")
+
+    relations = {}
+    for name, desc in tags:
+        related = parsed.get(name, {}).get("related")
+        if isinstance(related, list):
+            relations[name] = [r for r in related if isinstance(r, str)]
+        else:
+            relations[name] = find_related_markets(name, desc, candidates, client)
+    return relations
+
+def report_requests(label, items, calls):
+    print(f"{label}: {items} items in {calls} AI requests "
+          f"(per-item path: {items}, saved {items - calls})")
 
 # 2. Fetch MCC Codes
 MCC_URL = "https://raw.githubusercontent.com/greggles/mcc-codes/main/mcc_codes.csv"
-mcc_services = []
-
-print("Fetching MCC codes...")
-api_key = get_api_key()
-if api_key:
-    print("OpenAI API Key found. Using AI for naming...")
-else:
-    print("No OpenAI API Key found. Using heuristics...")
-
-name_cache = load_cache()
-cache_updated = False
-
-try:
-    with urllib.request.urlopen(MCC_URL) as response:
-        decoded_content = response.read().decode('utf-8')
-        reader = csv.DictReader(decoded_content.splitlines())
-        
-        seen_names = set()
-        for manual in SPECIFIC_SERVICES_MANUAL:
-            seen_names.add(manual["name"].lower())
-
-        for row in reader:
-            raw_desc = row.get("edited_description", "").strip()
-            # Clean up character artifacts first
-            original_name = clean_text(raw_desc.replace('"', '').strip())
-            
-            if not original_name:
-                continue
+# Local copy of MCC_URL; refreshed only with --refresh-mcc (or when missing)
+MCC_SNAPSHOT_FILE = os.path.join("tooling", "mcc_codes.csv")
+# Default cProfile output for --profile
+PROFILE_FILE = os.path.join("tooling", "generate_tags_db.prof")
 
-            mcc_code = row.get("mcc", "")
+class BuildPaths:
+    """Every file one generator run reads or writes.
 
-            # Determine final name
-            # 1. Check Custom Mapping
-            if mcc_code in SHORT_NAME_MAPPING:
-                final_name = SHORT_NAME_MAPPING[mcc_code]
-            # 2. Check Cache
-            elif mcc_code in name_cache:
-                final_name = name_cache[mcc_code]
-            # 3. Generate AI Name ONLY if description is > 3 words
-            elif len(original_name.split()) > 3:
-                final_name = generate_short_name(original_name, api_key)
-                if final_name:
-                    print(f"AI Generated (Long > 3): '{original_name}' -> '{final_name}'")
-                    name_cache[mcc_code] = final_name
-                    cache_updated = True
-            # 4. Short enough to keep as is
-            else:
-                 final_name = original_name
-            
-            if not final_name:
-                continue
-
-            # Skip if already manually defined (checks final name)
-            if final_name.lower() in seen_names:
-                continue
-            
-            # Simple heuristic filter
-            if len(final_name) < 3 or final_name.lower().startswith("test"):
-                continue
-
-            # Description logic:
-            # User request: "ONLY shorten the name, leave the description as is."
-            # Prefer combined_description (usually richer), else fall back to encoded/original name.
-            raw_combined = row.get("combined_description", "").strip()
-            
-            if raw_combined:
-                desc = raw_combined
+    Caches, state, .env and the MCC snapshot live under `base_dir`; the tag
+    DB files go to `output_dir` (default base_dir/apps/desktop/assets/data, the
+    DB every other tool reads by default).
+    """
+
+    def __init__(self, base_dir=".", output_dir=None):
+        self.base_dir = os.path.abspath(base_dir)
+        self.output_dir = os.path.abspath(output_dir or os.path.join(self.base_dir, OUTPUT_DIR))
+        self.cache_store = os.path.join(self.base_dir, CACHE_STORE_FILE)
+        self.legacy_names = os.path.join(self.base_dir, CACHE_FILE)
+        self.legacy_relations = os.path.join(self.base_dir, RELATIONS_CACHE_FILE)
+        self.env = os.path.join(self.base_dir, ENV_FILE)
+        self.state = os.path.join(self.base_dir, STATE_FILE)
+        self.learned_vendors = os.path.join(self.base_dir, LEARNED_VENDORS_FILE)
+        self.mcc_snapshot = os.path.join(self.base_dir, MCC_SNAPSHOT_FILE)
+        self.profile = os.path.join(self.base_dir, PROFILE_FILE)
+        self.yaml = os.path.join(self.output_dir, "db_tags.yaml")
+        self.json = os.path.join(self.output_dir, "db_tags.json")
+        self.binary = os.path.join(self.output_dir, "db_tags.bin")
+
+def parse_args(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Generate db_tags.yaml / db_tags.json")
+    parser.add_argument("--base-dir", default=".",
+                        help="Directory holding tooling/ (caches, MCC snapshot) and .env (default: current directory)")
+    parser.add_argument("--output-dir",
+                        help=f"Where to write db_tags.yaml/.json/.bin (default: BASE_DIR/{OUTPUT_DIR})")
+    parser.add_argument("--concurrency", type=int, default=8, help="Max in-flight AI requests")
+    parser.add_argument("--rate", type=float, default=5.0, help="Max AI requests per second (0 = unlimited)")
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries per AI request on 429/5xx")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Descriptions/tags per AI request (1 = one request per item)")
+    parser.add_argument("--cache-ttl-days", type=float, default=None,
+                        help="Treat cached AI answers older than this as misses")
+    parser.add_argument("--compact-cache", action="store_true",
+                        help="Drop expired/superseded entries from the cache log after the run")
+    parser.add_argument("--refresh-mcc", action="store_true",
+                        help="Conditionally re-download the MCC snapshot (ETag/Last-Modified)")
+    parser.add_argument("--offline", action="store_true",
+                        help="Never touch the network for MCC data; fail if there is no snapshot")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse tags whose source records are unchanged since the last build")
+    parser.add_argument("--local-relations", action="store_true",
+                        help="Take related markets from similar already-related tags when they agree, "
+                             "asking the AI only for the rest")
+    parser.add_argument("--min-relations-confidence", type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help=f"Confidence below which --local-relations asks the AI (default: {DEFAULT_MIN_CONFIDENCE})")
+    parser.add_argument("--keep-duplicates", action="store_true",
+                        help="Skip the consolidation stage: keep near-duplicate tags and drop MCC codes "
+                             "whose name is already taken")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Also write the JSON run summary to PATH")
+    parser.add_argument("--profile", nargs="?", const=True, metavar="PATH",
+                        help=f"Run under cProfile, dump pstats data to PATH (default BASE_DIR/{PROFILE_FILE}) "
+                             "and print the top functions")
+    return parser.parse_args(argv)
+
+class TagBuild:
+    """State shared by the stages of one generator run."""
+
+    def __init__(self, args, metrics, paths=None):
+        self.args = args
+        self.metrics = metrics
+        self.paths = paths or BuildPaths(args.base_dir, args.output_dir)
+        self.client = None
+        self.cache = None
+        self.ai_model = DEFAULT_MODEL
+        self.market_names = [m["name"] for m in MARKETS]
+        # Dirty tracking: every source record gets a fingerprint over its own fields plus
+        # the prompts/candidates that shape its tag. In --incremental mode a record whose
+        # fingerprint matches the last build reuses that build's result. Whether the
+        # answers come from the AI or the heuristics is part of the fingerprint, so
+        # a keyless build's records are rebuilt once a key is available.
+        self.previous_records = {}
+        self.records = {}
+        self.regenerated = []
+
+    @property
+    def answer_source(self):
+        return "ai" if self.client else "heuristic"
+
+    @property
+    def naming_context(self):
+        return [SHORT_NAME_PROMPT, self.ai_model, self.answer_source]
+
+    @property
+    def relations_context(self):
+        return [RELATIONS_PROMPT, self.ai_model, self.market_names, self.answer_source]
+
+    def track(self, record_id, *inputs):
+        # Returns the previous build's entry when the record is clean, else None
+        if record_id in self.records:
+            return None if record_id in self.regenerated else self.records[record_id]
+        fp = fingerprint(*inputs)
+        previous = self.previous_records.get(record_id)
+        if previous is not None and previous.get("fingerprint") == fp:
+            self.records[record_id] = dict(previous)
+            return previous
+        self.records[record_id] = {"fingerprint": fp}
+        self.regenerated.append(record_id)
+        return None
+
+    def fell_back(self, record_id):
+        # The AI did not answer for this record (the request failed, or the related
+        # index guessed it), so its result is a stand-in: mark the fingerprint so
+        # the next --incremental build does not reuse it
+        record = self.records[record_id]
+        if not record["fingerprint"].startswith("fallback:"):
+            record["fingerprint"] = "fallback:" + record["fingerprint"]
+
+    def run_ai_pass(self, func, items):
+        # Fan out over the client's worker pool; results keep the order of `items`
+        if self.client:
+            return self.client.map(func, items)
+        return [func(item) for item in items]
+
+    def ai_calls(self):
+        return self.client.calls if self.client else 0
+
+    def name_key(self, description, prompt=None):
+        return cache_key(prompt or SHORT_NAME_PROMPT, self.ai_model, description)
+
+    def remember_name(self, description, name):
+        # Stored as soon as it arrives so a crash mid-pass keeps the answer. Only AI
+        # replies are cached: heuristic names (no client) are cheap to recompute, and
+        # a failed request (None) is asked again next build.
+        if self.client and name:
+            self.cache.put(self.name_key(description), name, "mcc_name", description)
+        return name
+
+    def relations_key(self, tag, prompt=None):
+        return cache_key(prompt or RELATIONS_PROMPT, self.ai_model, tag["name"], tag.get("description", ""),
+                         self.market_names)
+
+    def remember_relations(self, tag, related):
+        # None (a failed request) is passed through and not cached, like remember_name
+        if related is None:
+            return None
+        valid_related = [r for r in related if r in self.market_names]
+        self.cache.put(self.relations_key(tag), valid_related, "relations", tag["name"])
+        return valid_related
+
+    def write(self, path, content):
+        # write_if_changed, counting the bytes that actually hit the disk
+        written = write_if_changed(path, content)
+        if written:
+            size = len(content) if isinstance(content, bytes) else len(content.encode("utf-8"))
+            self.metrics.wrote(path, size)
+        return written
+
+def ensure_mcc_snapshot(args, snapshot_file):
+    # True when there is a snapshot to read after (optionally) refreshing it
+    if args.offline:
+        return os.path.exists(snapshot_file)
+    if args.refresh_mcc or not os.path.exists(snapshot_file):
+        print(f"Checking {MCC_URL} for MCC updates...")
+        try:
+            if refresh_snapshot(MCC_URL, snapshot_file):
+                print(f"Downloaded MCC snapshot v{load_meta(snapshot_file).get('version')} to {snapshot_file}")
             else:
-                desc = original_name
+                print("MCC snapshot is up to date.")
+        except (urllib.error.URLError, OSError) as e:
+            print(f"Warning: Could not refresh MCC snapshot: {e}")
+    return os.path.exists(snapshot_file)
+
+def setup(build):
+    """MCC snapshot, AI client, cache and the previous build's state.
+
+    Raises FileNotFoundError in --offline mode when there is no MCC snapshot.
+    """
+    args, paths = build.args, build.paths
+    print("Loading MCC codes...")
+    if not ensure_mcc_snapshot(args, paths.mcc_snapshot):
+        if args.offline:
+            raise FileNotFoundError(f"No MCC snapshot at {paths.mcc_snapshot} (--offline)")
+        print(f"Error: No MCC snapshot at {paths.mcc_snapshot}. MCC services will be MISSING from the output.")
+    api_key = get_api_key(paths.env)
+    if api_key:
+        print("OpenAI API Key found. Using AI for naming...")
+        build.client = ChatClient(
+            api_key,
+            url=read_env_setting("OPENAI_API_URL", paths.env) or DEFAULT_API_URL,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            max_retries=args.max_retries,
+        )
+        build.ai_model = build.client.model
+    else:
+        print("No OpenAI API Key found. Using heuristics...")
+
+    build.cache = CacheStore(paths.cache_store, ttl=args.cache_ttl_days * 86400 if args.cache_ttl_days else None)
+    build.previous_records = load_state(paths.state).get("records", {}) if args.incremental else {}
+
+def read_mcc_rows(snapshot_file):
+    """[(csv row, cleaned description)] from the MCC snapshot."""
+    rows = []
+    for row in iter_mcc_rows(snapshot_file):
+        raw_desc = row.get("edited_description", "").strip()
+        # Clean up character artifacts first
+        original_name = clean_text(raw_desc.replace('"', '').strip())
+        if original_name:
+            rows.append((row, original_name))
+    return rows
+
+def naming_pass(build, rows):
+    """Short names for the MCC rows; returns (mcc_services, their record ids)."""
+    cache, client = build.cache, build.client
+    names = {}
+    mcc_services = []
+    mcc_records = []
+
+    # Old mcc_name_cache.json is keyed by MCC code; re-key it by description
+    legacy_file = build.paths.legacy_names
+    legacy_names = load_legacy_cache(legacy_file)
+    if legacy_names:
+        legacy_created = os.path.getmtime(legacy_file)
+        imported = 0
+        for row, original_name in rows:
+            mcc_code = row.get("mcc", "")
+            if mcc_code in legacy_names:
+                imported += cache.import_legacy(build.name_key(original_name, LEGACY_SHORT_NAME_PROMPT),
+                                                legacy_names[mcc_code],
+                                                "mcc_name", original_name, legacy_created)
+        if imported:
+            print(f"Imported {imported} names from {legacy_file}")
+
+    # 2a. Naming pass: only long descriptions without a mapping/cache entry need the AI.
+    # They are resolved concurrently up front, then merged back in CSV order below.
+    pending = {}
+    for row, original_name in rows:
+        mcc_code = row.get("mcc", "")
+        previous = build.track(f"MCC:{mcc_code}", row, SHORT_NAME_MAPPING.get(mcc_code),
+                               build.naming_context, build.relations_context)
+        if previous is not None and "name" in previous:
+            names[mcc_code] = previous["name"]
+            continue
+        if mcc_code in SHORT_NAME_MAPPING or len(original_name.split()) <= 3:
+            continue
+        cached = cache.get(build.name_key(original_name), "mcc_name")
+        if cached:
+            names[mcc_code] = cached
+        else:
+            pending[mcc_code] = original_name
+
+    calls_before = build.ai_calls()
+    if build.args.batch_size > 1:
+        batches = build.run_ai_pass(
+            lambda batch: {mcc_code: build.remember_name(pending[mcc_code], name)
+                           for mcc_code, name in generate_short_names_batch(batch, client).items()},
+            chunked(pending.items(), build.args.batch_size),
+        )
+        generated = [name for batch in batches for name in batch.values()]
+    else:
+        generated = build.run_ai_pass(lambda desc: build.remember_name(desc, generate_short_name(desc, client)),
+                                      list(pending.values()))
+    build.metrics.count("naming_pass.items", len(pending))
+    build.metrics.count("naming_pass.ai_calls", build.ai_calls() - calls_before)
+    if client and pending:
+        report_requests("Naming pass", len(pending), build.ai_calls() - calls_before)
+
+    for (mcc_code, original_name), final_name in zip(pending.items(), generated):
+        if final_name is None:
+            # The AI request failed: the heuristic name stands in for this build only
+            final_name = shorten_name(original_name)
+            build.fell_back(f"MCC:{mcc_code}")
+        if final_name:
+            print(f"AI Generated (Long > 3): '{original_name}' -> '{final_name}'")
+            names[mcc_code] = final_name
+
+    seen_names = set()
+    for manual in SPECIFIC_SERVICES_MANUAL:
+        seen_names.add(manual["name"].lower())
+
+    for row, original_name in rows:
+        mcc_code = row.get("mcc", "")
+
+        # Determine final name
+        # 1. Check Custom Mapping
+        if mcc_code in SHORT_NAME_MAPPING:
+            final_name = SHORT_NAME_MAPPING[mcc_code]
+        # 2. Check Cache (includes names generated by the pass above)
+        elif mcc_code in names:
+            final_name = names[mcc_code]
+        # 3. AI Name was requested ONLY if description is > 3 words
+        elif len(original_name.split()) > 3:
+            final_name = None
+        # 4. Short enough to keep as is
+        else:
+            final_name = original_name
+
+        build.records[f"MCC:{mcc_code}"]["name"] = final_name
+        if not final_name:
+            continue
+
+        # Skip if already manually defined (checks final name); otherwise the
+        # consolidation stage folds the code into the tag that has the name
+        if final_name.lower() in seen_names and build.args.keep_duplicates:
+            continue
+
+        # Simple heuristic filter
+        if len(final_name) < 3 or final_name.lower().startswith("test"):
+            continue
+
+        # Description logic:
+        # User request: "ONLY shorten the name, leave the description as is."
+        # Prefer combined_description (usually richer), else fall back to encoded/original name.
+        raw_combined = row.get("combined_description", "").strip()
 
-            desc = clean_text(desc)
-            
-            mcc_services.append({
-                "name": final_name,
-                "description": desc,
-                "source": "ISO-18245 (MCC)",
-                "mcc_id": mcc_code
-            })
-            seen_names.add(final_name.lower())
+        if raw_combined:
+            desc = raw_combined
+        else:
+            desc = original_name
 
-    if cache_updated:
-        save_cache(name_cache)
-        print("Updated name cache.")
+        desc = clean_text(desc)
 
-except Exception as e:
-    print(f"Error fetching MCC codes: {e}")
+        mcc_services.append({
+            "name": final_name,
+            "description": desc,
+            "source": "ISO-18245 (MCC)",
+            "mcc_id": mcc_code
+        })
+        mcc_records.append(f"MCC:{mcc_code}")
+        seen_names.add(final_name.lower())
+
+    return mcc_services, mcc_records
 
 # 3. Combine All Tags
-all_tags = []
-
-for t in VENDORS:
-    tag = {
-        "name": t["name"],
-        "type": "Vendor",
-        "description": f"Vendor: {t['name']}",
-        "regex": f"(?i){t['name']}"
-    }
-    if "system_tags" in t:
-        tag["related"] = t["system_tags"]
-    all_tags.append(tag)
-
-for t in MARKETS:
-    all_tags.append({
-        "name": t["name"],
-        "type": "Market",
-        "description": t["description"]
-    })
-
-for t in SYSTEM_TAGS:
-    all_tags.append({
-        "name": t["name"],
-        "type": "System",
-        "description": t["description"]
-    })
-
-for t in SPECIFIC_SERVICES_MANUAL:
-    all_tags.append({
-        "name": t["name"],
-        "type": "Service",
-        "description": t["description"],
-        "source": "Manual"
-    })
-
-for t in mcc_services:
-    all_tags.append({
-        "name": t["name"],
-        "type": "Service",
-        "description": t["description"],
-        "mcc_id": t.get("mcc_id"),
-        "source": "MCC"
-    })
+def combine_tags(build, mcc_services, mcc_records):
+    """Returns (all_tags, tag_records): the tag list and each tag's source record id."""
+    all_tags = []
+    tag_records = []
+    learned = {v["name"]: v for v in load_learned_vendors(build.paths.learned_vendors)}
+
+    for t in VENDORS:
+        tag = {
+            "name": t["name"],
+            "type": "Vendor",
+            "description": f"Vendor: {t['name']}",
+            "regex": vendor_regex(t["name"], learned.pop(t["name"], {}).get("patterns", ()))
+        }
+        if "system_tags" in t:
+            tag["related"] = t["system_tags"]
+        all_tags.append(tag)
+        tag_records.append(f"Vendor:{t['name']}")
+        build.track(f"Vendor:{t['name']}", t, build.relations_context)
+
+    # Vendors the AI fallback found in unmatched transactions. Their markets were
+    # asked for when they were learned, so they skip the cross-reference pass.
+    for t in learned.values():
+        all_tags.append(learned_vendor_tag(t))
+        tag_records.append(f"Learned:{t['name']}")
+        build.track(f"Learned:{t['name']}", t)
+        build.records[f"Learned:{t['name']}"]["related"] = all_tags[-1]["related"]
+
+    for t in MARKETS:
+        tag = {
+            "name": t["name"],
+            "type": "Market",
+            "description": t["description"]
+        }
+        # Declared parent markets (Records -> Music), needed for the related closure
+        if "related" in t:
+            tag["related"] = t["related"]
+        all_tags.append(tag)
+        tag_records.append(f"Market:{t['name']}")
+        build.track(f"Market:{t['name']}", t)
+
+    for t in SYSTEM_TAGS:
+        all_tags.append({
+            "name": t["name"],
+            "type": "System",
+            "description": t["description"]
+        })
+        tag_records.append(f"System:{t['name']}")
+        build.track(f"System:{t['name']}", t)
+
+    for t in SPECIFIC_SERVICES_MANUAL:
+        tag = {
+            "name": t["name"],
+            "type": "Service",
+            "description": t["description"],
+            "source": "Manual"
+        }
+        # Merged with the AI market relations in the second pass
+        if "related" in t:
+            tag["related"] = t["related"]
+        all_tags.append(tag)
+        tag_records.append(f"Manual:{t['name']}")
+        build.track(f"Manual:{t['name']}", t, build.relations_context)
+
+    for t in mcc_services:
+        all_tags.append({
+            "name": t["name"],
+            "type": "Service",
+            "description": t["description"],
+            "mcc_id": t.get("mcc_id"),
+            "source": "MCC"
+        })
+    tag_records.extend(mcc_records)
+    return all_tags, tag_records
 
 # 3b. Second Pass: Cross-Referencing (Tags -> Markets)
-print("Starting Second Pass: Cross-Referencing Tags...")
-relations_cache = load_relations_cache()
-relations_updated = False
-market_names = [m["name"] for m in MARKETS]
-
-for tag in all_tags:
-    # Only process Vendors and Services
-    if tag["type"] not in ["Vendor", "Service"]:
-        continue
-    
-    # key for cache
-    tag_key = tag["name"]
-    
-    # Merge with existing tags (e.g. System tags manually added)
-    existing_related = tag.get("related", [])
-    
-    ai_related = []
-    if tag_key in relations_cache:
-        ai_related = relations_cache[tag_key]
+def cross_reference_pass(build, all_tags, tag_records):
+    """Fills in `related` for Vendor and Service tags."""
+    cache, client, records = build.cache, build.client, build.records
+    market_names = build.market_names
+    print("Starting Second Pass: Cross-Referencing Tags...")
+
+    # Old tag_relations_cache.json is keyed by tag name
+    legacy_file = build.paths.legacy_relations
+    legacy_relations = load_legacy_cache(legacy_file)
+    if legacy_relations:
+        legacy_created = os.path.getmtime(legacy_file)
+        imported = 0
+        for tag in all_tags:
+            if tag["type"] in ["Vendor", "Service"] and tag["name"] in legacy_relations:
+                imported += cache.import_legacy(build.relations_key(tag, LEGACY_RELATIONS_PROMPT),
+                                                legacy_relations[tag["name"]],
+                                                "relations", tag["name"], legacy_created)
+        if imported:
+            print(f"Imported {imported} relations from {legacy_file}")
+
+    # Tags missing from the cache are asked about concurrently, then merged in tag order.
+    relations = {}
+    pending_tags = []
+    for tag, record_id in zip(all_tags, tag_records):
+        if tag["type"] not in ["Vendor", "Service"] or "related" in records[record_id]:
+            continue  # Clean records keep the related list from the last build
+        key = build.relations_key(tag)
+        # The same prompt can come from more than one tag; only look it up once
+        if key in relations:
+            continue
+        cached = cache.get(key, "relations")
+        if cached is not None:
+            relations[key] = cached
+        elif client:
+            relations[key] = []  # Placeholder until the AI answers below
+            pending_tags.append(tag)
+
+    # Keys whose relations are not AI answers; their records are asked about again next build
+    stand_ins = set()
+    if build.args.local_relations and pending_tags:
+        left = local_relations_pass(build, all_tags, tag_records, relations, pending_tags)
+        stand_ins = {build.relations_key(tag) for tag in pending_tags} - {build.relations_key(tag) for tag in left}
+        pending_tags = left
+
+    calls_before = build.ai_calls()
+    if build.args.batch_size > 1:
+        def relate_batch(batch):
+            found = find_related_markets_batch(
+                [(tag["name"], tag.get("description", "")) for tag in batch], market_names, client)
+            return [build.remember_relations(tag, found[tag["name"]]) for tag in batch]
+
+        batches = build.run_ai_pass(relate_batch, chunked(pending_tags, build.args.batch_size))
+        answers = [related for batch in batches for related in batch]
     else:
-        # Ask AI
-        if api_key:
-            related = find_related_markets(tag["name"], tag.get("description", ""), market_names, api_key)
-            if related:
-                valid_related = [r for r in related if r in market_names]
-                print(f"AI Related: '{tag['name']}' -> {valid_related}")
-                ai_related = valid_related
-                relations_cache[tag_key] = valid_related
-                relations_updated = True
+        answers = build.run_ai_pass(
+            lambda tag: build.remember_relations(
+                tag, find_related_markets(tag["name"], tag.get("description", ""), market_names, client)),
+            pending_tags,
+        )
+    build.metrics.count("cross_reference_pass.items", len(pending_tags))
+    build.metrics.count("cross_reference_pass.ai_calls", build.ai_calls() - calls_before)
+    if client and pending_tags:
+        report_requests("Cross-reference pass", len(pending_tags), build.ai_calls() - calls_before)
+
+    for tag, valid_related in zip(pending_tags, answers):
+        if valid_related:
+            print(f"AI Related: '{tag['name']}' -> {valid_related}")
+        # A failed request leaves the tag without AI relations for this build
+        if valid_related is None:
+            stand_ins.add(build.relations_key(tag))
+        relations[build.relations_key(tag)] = valid_related if valid_related is not None else []
+
+    for tag, record_id in zip(all_tags, tag_records):
+        # Only process Vendors and Services
+        if tag["type"] not in ["Vendor", "Service"]:
+            continue
+
+        record = records[record_id]
+        if "related" in record:
+            tag["related"] = record["related"]
+            continue
+
+        # Merge with existing tags (e.g. System tags manually added)
+        existing_related = tag.get("related", [])
+
+        ai_related = relations.get(build.relations_key(tag), [])
+        if build.relations_key(tag) in stand_ins:
+            build.fell_back(record_id)
+
+        # Final merge: System Tags + AI Market Tags (deduplicated)
+        if ai_related:
+            tag["related"] = list(dict.fromkeys(existing_related + ai_related))
+        elif existing_related:
+             tag["related"] = existing_related 
+        else:
+             tag["related"] = []
+        record["related"] = tag["related"]
+
+def local_relations_pass(build, all_tags, tag_records, relations, pending_tags):
+    """Fills `relations` for the pending tags the related index is confident
+    about; returns the tags still left for the AI.
+
+    The index is labelled with this build's tags whose relations are known
+    (cached or clean), then the Vendor/Service tags of the previous db_tags.json.
+    """
+    pending_keys = {build.relations_key(tag) for tag in pending_tags}
+    labelled = {}
+    known = {}
+    for tag, record_id in zip(all_tags, tag_records):
+        if tag["type"] not in ["Vendor", "Service"] or tag["name"] in known:
+            continue
+        key = build.relations_key(tag)
+        if "related" in build.records[record_id]:
+            known[tag["name"]] = build.records[record_id]["related"]
+        elif key in relations and key not in pending_keys:
+            known[tag["name"]] = relations[key]
+        else:
+            continue
+        labelled[tag["name"]] = tag
+    try:
+        previous_tags = load_tag_db(build.paths.json, use_snapshot=False).tags
+    except (OSError, ValueError):
+        previous_tags = []
+    for tag in previous_tags:
+        if tag.get("type") in ["Vendor", "Service"] and tag["name"] not in known:
+            known[tag["name"]] = tag.get("related", [])
+            labelled[tag["name"]] = tag
+    index = RelatedIndex.from_tags(labelled.values(), known, MARKETS)
+
+    left = []
+    for tag in pending_tags:
+        related, confidence = index.suggest(tag_text(tag))
+        if confidence >= build.args.min_relations_confidence:
+            relations[build.relations_key(tag)] = related
+        else:
+            left.append(tag)
+    answered = len(pending_tags) - len(left)
+    build.metrics.count("cross_reference_pass.local", answered)
+    print(f"Local relations: {answered} of {len(pending_tags)} tags answered from {len(known)} related tags "
+          f"without the AI (min confidence {build.args.min_relations_confidence})")
+    return left
+
+# 3b'. Merge duplicate and near-duplicate tags (see tag_consolidate)
+def consolidate_pass(build, all_tags):
+    """Returns (tags, aliases): one tag per duplicate cluster, and old name -> canonical name."""
+    if build.args.keep_duplicates:
+        return all_tags, {}
+    tags, aliases, merged = consolidate(all_tags)
+    dropped = sum(len(indexes) for _, indexes in merged)
+    build.metrics.count("consolidate.merged", dropped)
+    if merged:
+        print(f"Consolidated {dropped} duplicate tags into {len(merged)} tags ({len(aliases)} aliases):")
+        for canonical, indexes in merged[:10]:
+            print(f" - {all_tags[canonical]['name']} ({all_tags[canonical]['type']}) <- "
+                  + ", ".join(f"{all_tags[i]['name']} ({all_tags[i]['type']})" for i in indexes))
+        if len(merged) > 10:
+            print(f" ... and {len(merged) - 10} more")
+    return tags, aliases
+
+def finish_cache(build):
+    build.cache.close()
+    if build.args.compact_cache:
+        dropped = build.cache.compact()
+        print(f"Compacted cache: dropped {dropped} expired/superseded entries.")
+    build.cache.report()
+
+# 3c. Precompute the transitive closure of `related` for consumers.
+def closure_section(all_tags):
+    """The `related_closure` section of db_tags.json.
+
+    Stored CSR-style against tag indexes: the full expansion of all_tags[i] is
+    targets[offsets[i]:offsets[i + 1]]. Names shared by several tags (e.g. Fast Food
+    as Market and Service) are expanded to all of them; names that are not tags are dropped.
+    """
+    graph = {}
+    tag_indexes = {}
+    for i, tag in enumerate(all_tags):
+        tag_indexes.setdefault(tag["name"], []).append(i)
+        edges = graph.setdefault(tag["name"], [])
+        edges.extend(r for r in tag.get("related", []) if r not in edges)
+    closure, cycles = related_closure(graph)
+
+    offsets = [0]
+    targets = []
+    dangling = set()
+    for i, tag in enumerate(all_tags):
+        for name in closure[tag["name"]]:
+            if name in tag_indexes:
+                targets.extend(j for j in tag_indexes[name] if j != i)
             else:
-                 relations_cache[tag_key] = []
-                 relations_updated = True
-    
-    # Final merge: System Tags + AI Market Tags (deduplicated)
-    if ai_related:
-        tag["related"] = list(dict.fromkeys(existing_related + ai_related))
-    elif existing_related:
-         tag["related"] = existing_related 
-    else:
-         tag["related"] = []
-
-if relations_updated:
-    save_cache(relations_cache, RELATIONS_CACHE_FILE)
-    print("Updated relations cache.")
-
-# 4. Write to YAML (Manual formatting to avoid pyyaml dependency)
-output_path = os.path.join(os.getcwd(), "assets", "data", "db_tags.yaml")
-os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-def escape_yaml_str(s):
-    if not s: return ""
-    # Basic escaping for single-line strings
-    if ":" in s or "#" in s or "[" in s or "]" in s or "{" in s or "}" in s or '"' in s:
-        return '"' + s.replace('"', '\\"') + '"'
-    return s
-
-try:
-    with open(output_path, "w") as f:
-        f.write("tags:\n")
-        for tag in all_tags:
-            f.write("  - name: " + escape_yaml_str(tag["name"]) + "\n")
-            f.write("    type: " + escape_yaml_str(tag["type"]) + "\n")
-            
-            # Handle description carefully
-            desc = tag.get("description", "").replace("\n", " ").strip()
-            if desc:
-                f.write("    description: " + escape_yaml_str(desc) + "\n")
-            
-            if "regex" in tag:
-                f.write("    regex: " + escape_yaml_str(tag["regex"]) + "\n")
-
-            if "source" in tag:
-                f.write("    source: " + escape_yaml_str(tag["source"]) + "\n")
-            
-            if "mcc_id" in tag and tag["mcc_id"]:
-                 f.write("    mcc_id: " + escape_yaml_str(tag["mcc_id"]) + "\n")
-            
-            if "related" in tag and tag["related"]:
-                f.write("    related:\n")
-                for related_tag in tag["related"]:
-                    f.write(f"      - {escape_yaml_str(related_tag)}\n")
-
-    print(f"Successfully wrote {len(all_tags)} tags to {output_path}")
-    print(f" - Vendors: {len(VENDORS)}")
-    print(f" - Markets: {len(MARKETS)}")
-    print(f" - System: {len(SYSTEM_TAGS)}")
-    print(f" - Manual Services: {len(SPECIFIC_SERVICES_MANUAL)}")
-    print(f" - MCC Services: {len(mcc_services)}")
-
-except Exception as e:
-    print(f"Error writing YAML file: {e}")
-
-# 5. Write to JSON (For Flutter App Consumption)
-json_output_path = os.path.join(os.getcwd(), "assets", "data", "db_tags.json")
-try:
-    with open(json_output_path, "w") as f:
-        json.dump({"tags": all_tags}, f, indent=2)
-    print(f"Successfully wrote JSON to {json_output_path}")
-except Exception as e:
-    print(f"Error writing JSON file: {e}")
+                dangling.add(name)
+        offsets.append(len(targets))
+
+    if cycles:
+        print(f"Related cycles: {'; '.join(' <-> '.join(c) for c in cycles)}")
+    if dangling:
+        print(f"Related names with no tag (left out of the closure): {len(dangling)}")
+    return {"version": 1, "offsets": offsets, "targets": targets}
+
+def write_outputs(build, all_tags, related_closure_section, mcc_service_count, aliases=None):
+    # 4. Write to YAML (Manual formatting to avoid pyyaml dependency)
+    output_path = build.paths.yaml
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    try:
+        yaml_text = to_yaml(all_tags)
+        # Re-parsed with pyyaml when it happens to be installed; the emitter itself does not need it.
+        # Text that is already on disk was checked when it was written.
+        yaml_problems = None if file_has(output_path, yaml_text) else yaml_mismatches(yaml_text, all_tags)
+        if yaml_problems:
+            print(f"Error: YAML does not read back as the tags, not written: {yaml_problems[0]}")
+        elif build.write(output_path, yaml_text):
+            print(f"Successfully wrote {len(all_tags)} tags to {output_path}")
+        else:
+            print(f"{output_path} unchanged ({len(all_tags)} tags), not rewritten")
+        print(f" - Vendors: {len(VENDORS)}")
+        print(f" - Markets: {len(MARKETS)}")
+        print(f" - System: {len(SYSTEM_TAGS)}")
+        print(f" - Manual Services: {len(SPECIFIC_SERVICES_MANUAL)}")
+        print(f" - MCC Services: {mcc_service_count}")
+
+    except Exception as e:
+        print(f"Error writing YAML file: {e}")
+
+    # 5. Write to JSON (For Flutter App Consumption)
+    json_output_path = build.paths.json
+    try:
+        if build.write(json_output_path, to_json(all_tags, related_closure_section, aliases)):
+            print(f"Successfully wrote JSON to {json_output_path}")
+        else:
+            print(f"{json_output_path} unchanged, not rewritten")
+    except Exception as e:
+        print(f"Error writing JSON file: {e}")
+
+    # 5b. Write the binary copy (memory-mapped by BinaryTagDB), after checking it reads back as the JSON
+    binary_output_path = build.paths.binary
+    try:
+        binary = to_binary(all_tags, related_closure_section, aliases)
+        problems = ([] if file_has(binary_output_path, binary)
+                    else binary_mismatches(all_tags, related_closure_section, BinaryTagDB(binary), aliases))
+        if problems:
+            print(f"Error: binary tag DB does not round-trip, not written: {problems[0]}")
+        elif build.write(binary_output_path, binary):
+            print(f"Successfully wrote {len(binary)} bytes to {binary_output_path}")
+        else:
+            print(f"{binary_output_path} unchanged, not rewritten")
+    except Exception as e:
+        print(f"Error writing binary file: {e}")
+
+# 6. Remember what this build was made from, for the next --incremental run
+def save_state(build):
+    records, regenerated = build.records, build.regenerated
+    state_file = build.paths.state
+    try:
+        os.makedirs(os.path.dirname(state_file), exist_ok=True)
+        build.write(state_file, json.dumps({"version": 1, "records": records}, indent=2))
+    except OSError as e:
+        print(f"Warning: Could not save build state: {e}")
+
+    if build.args.incremental:
+        print(f"Incremental build: regenerated {len(regenerated)} of {len(records)} source records.")
+        by_kind = {}
+        for record_id in regenerated:
+            kind, name = record_id.split(":", 1)
+            by_kind.setdefault(kind, []).append(name)
+        for kind, kind_names in by_kind.items():
+            more = f" (+{len(kind_names) - 10} more)" if len(kind_names) > 10 else ""
+            print(f" - {kind}: {', '.join(kind_names[:10])}{more}")
+
+def run(build):
+    stage = build.metrics.stage
+    with stage("setup"):
+        setup(build)
+
+    mcc_services, mcc_records = [], []
+    try:
+        with stage("mcc_parse"):
+            rows = read_mcc_rows(build.paths.mcc_snapshot)
+        with stage("naming_pass"):
+            mcc_services, mcc_records = naming_pass(build, rows)
+    except Exception as e:
+        print(f"Error reading MCC codes: {e}")
+
+    with stage("combine"):
+        all_tags, tag_records = combine_tags(build, mcc_services, mcc_records)
+    with stage("cross_reference_pass"):
+        cross_reference_pass(build, all_tags, tag_records)
+    with stage("consolidate"):
+        all_tags, aliases = consolidate_pass(build, all_tags)
+    with stage("cache_flush"):
+        finish_cache(build)
+    with stage("closure"):
+        related_closure_section = closure_section(all_tags)
+    with stage("write"):
+        write_outputs(build, all_tags, related_closure_section, len(mcc_services), aliases)
+    with stage("save_state"):
+        save_state(build)
+    build.metrics.count("tags", len(all_tags))
+
+def run_summary(build):
+    cache_stats = {}
+    for ns, counts in (build.cache.stats() if build.cache else {}).items():
+        lookups = counts["hits"] + counts["misses"]
+        cache_stats[ns] = dict(counts, hit_ratio=round(counts["hits"] / lookups, 4) if lookups else None)
+    client = build.client
+    ai = {"enabled": client is not None}
+    if client:
+        ai.update(calls=client.calls, retries=client.retries, errors=client.errors,
+                  latency=latency_histogram(client.latencies))
+    return build.metrics.summary(ai=ai, cache=cache_stats)
+
+def generate(args, paths=None):
+    """One generator run; returns the run summary (see run_summary).
+
+    `args` is a parse_args() namespace, e.g. parse_args(["--offline"]).
+    Raises FileNotFoundError in --offline mode when there is no MCC snapshot.
+    """
+    build = TagBuild(args, RunMetrics(), paths)
+    run(build)
+    return run_summary(build)
+
+def main(argv=None, prog=None):
+    args = parse_args(argv, prog)
+    paths = BuildPaths(args.base_dir, args.output_dir)
+    profile_path = paths.profile if args.profile is True else args.profile
+    try:
+        if profile_path:
+            profiler = cProfile.Profile()
+            try:
+                summary = profiler.runcall(generate, args, paths)
+            finally:
+                profiler.dump_stats(profile_path)
+                print(f"Wrote profile data to {profile_path}")
+                pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+            summary["profile"] = profile_path
+        else:
+            summary = generate(args, paths)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return 1
+
+    text = json.dumps(summary, indent=2)
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(text + "\n")
+    print("Run summary:")
+    print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Local, versioned snapshot of the ISO-18245 MCC list.
+
+generate_tags_db.py reads MCC rows from a CSV snapshot on disk instead of
+downloading MCC_URL on every run. The snapshot is refreshed on request with a
+conditional GET: the ETag / Last-Modified of the last download are kept in a
+metadata file next to it, so an unchanged upstream costs one 304.
+"""
+import csv
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+
+def meta_path_for(snapshot_path):
+    return os.path.splitext(snapshot_path)[0] + ".meta.json"
+
+
+def load_meta(snapshot_path):
+    path = meta_path_for(snapshot_path)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read MCC snapshot metadata {path}: {e}")
+        return {}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def refresh_snapshot(url, snapshot_path, timeout=30):
+    """Conditionally re-downloads the snapshot.
+
+    Returns True if the snapshot changed, False if upstream answered 304 or
+    served identical bytes. The body is streamed to a temp file and renamed
+    over the snapshot, so a failed download never leaves a partial CSV.
+    Network errors propagate to the caller.
+    """
+    meta = load_meta(snapshot_path)
+    headers = {}
+    if os.path.exists(snapshot_path):
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        response = urllib.request.urlopen(req, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return False
+        raise
+
+    directory = os.path.dirname(snapshot_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with response, os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(response, out)
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+        sha = file_sha256(tmp_path)
+        if sha == meta.get("sha256") and os.path.exists(snapshot_path):
+            os.remove(tmp_path)
+            changed = False
+        else:
+            os.replace(tmp_path, snapshot_path)
+            changed = True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    meta.update({
+        "url": url,
+        "etag": etag,
+        "last_modified": last_modified,
+        "sha256": sha,
+        "version": meta.get("version", 0) + (1 if changed else 0),
+        "checked_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    })
+    with open(meta_path_for(snapshot_path), "w") as f:
+        json.dump(meta, f, indent=2)
+    return changed
+
+
+def iter_mcc_rows(snapshot_path):
+    """Streams the snapshot's rows as dicts without loading the file whole."""
+    with open(snapshot_path, "r", encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
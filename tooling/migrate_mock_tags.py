@@ -1,30 +1,24 @@
-import json
+"""Rewrites transaction categories to the canonical db_tags names.
+
+    budgetizer-tools migrate [PATH] [--db PATH] [--workers N]
+    python -m tooling.migrate_mock_tags ...    # the same
+"""
+import argparse
 import os
+import sys
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from .tag_db import DEFAULT_DB_DIR, DEFAULT_DB_PATH, load_tag_db
+from .tag_matcher import SubstringMatcher
+from .transactions import detect_format, iter_records, rewrite_records
+
+# Paths (relative to the working directory unless given explicitly)
+DB_TAGS_PATH = DEFAULT_DB_PATH
+MOCK_DATA_PATH = os.path.join(DEFAULT_DB_DIR, "mock_transactions.json")
 
-# Paths
-BASE_DIR = os.getcwd()
-DB_TAGS_PATH = os.path.join(BASE_DIR, "assets", "data", "db_tags.yaml")
-MOCK_DATA_PATH = os.path.join(BASE_DIR, "assets", "data", "mock_transactions.json")
-
-# 1. Load Allowable Tags
-if os.path.exists(DB_TAGS_PATH):
-    print(f"Loading tags from {DB_TAGS_PATH}...")
-    with open(DB_TAGS_PATH, "r") as f:
-        # Simple manual parse looking for "- name: Link"
-        ALLOWED_TAG_NAMES = set()
-        for line in f:
-            if "  - name: " in line:
-                # Strip "- name: " and quotes
-                raw_name = line.split("name: ")[1].strip()
-                clean_name = raw_name.strip("'").strip('"')
-                ALLOWED_TAG_NAMES.add(clean_name)
-else:
-    print("Error: db_tags.yaml not found!")
-    exit(1)
-
-print(f"Loaded {len(ALLOWED_TAG_NAMES)} valid canonical tags.")
-
-# 2. Define Manual Mappings (Simulate AI Classification)
+# Define Manual Mappings (Simulate AI Classification)
 # Key: Vendor Name (or substring), Value: List of [Market, Service, System...]
 # Vendor tag is preserved from the transaction name/ID.
 MAPPINGS = {
@@ -36,53 +30,203 @@ MAPPINGS = {
     "Salary Deposit": ["Income"],
     "Uber": ["Transport", "Ride Services"],
     # For generated randoms if they exist in the file:
-    "UBER RIDE": ["Transport", "Ride Services"], 
+    "UBER RIDE": ["Transport", "Ride Services"],
     "WHOLE FOODS": ["Groceries"]
 }
 
-# 3. Process Mock Data
-print(f"Processing {MOCK_DATA_PATH}...")
-with open(MOCK_DATA_PATH, "r") as f:
-    transactions = json.load(f)
+# How many vendors each warning summary lists before eliding the rest
+SUMMARY_LIMIT = 20
+
+# Set once per process by init_worker (the pool initializer), so the allowed
+# names and the compiled matcher are not pickled with every chunk
+_allowed_tag_names = None
+_mapping_matcher = None
+
+
+def init_worker(allowed_tag_names, mappings):
+    global _allowed_tag_names, _mapping_matcher
+    _allowed_tag_names = allowed_tag_names
+    # Compiled once: every substring lookup is then a single scan of the vendor name
+    _mapping_matcher = SubstringMatcher(mappings)
 
-updated_count = 0
-for tx in transactions:
+
+def migrate_transaction(tx, warnings):
+    """Rewrites tx["category"] in place; returns True if it was updated.
+
+    Problems are counted in `warnings` instead of printed: keys are
+    ("missing", tag, vendor) for a mapped tag absent from db_tags.json and
+    ("unmapped", None, vendor) for a vendor with no usable mapping.
+    """
     vendor_name = tx["name"]
     vendor_tag = tx["category"][0] # Legacy: First item was usually vendor-ish
-    
+
     # Logic: Keep the vendor tag (first item). Replace the rest with Canonical tags.
-    
+
     new_tags = [vendor_tag] # Start with Vendor
-    
+
     # Find mapping
     canonical_tags = []
     # Try exact match first
     if vendor_name in MAPPINGS:
         canonical_tags = MAPPINGS[vendor_name]
     else:
-        # Try substring match
-        for key, val in MAPPINGS.items():
-            if key.upper() in vendor_name.upper():
-                canonical_tags = val
-                break
-    
+        # Try substring match (longest key wins, e.g. "UBER RIDE" over "Uber")
+        canonical_tags = _mapping_matcher.longest(vendor_name) or []
+
     # Validate against DB
     valid_canonicals = []
     for tag in canonical_tags:
-        if tag in ALLOWED_TAG_NAMES:
-            valid_canonicals.append(tag)
+        # Names merged into another tag by the generator resolve to that tag
+        canonical = _allowed_tag_names.get(tag)
+        if canonical is not None:
+            if canonical not in valid_canonicals:
+                valid_canonicals.append(canonical)
         else:
-            print(f"Warning: mapped tag '{tag}' for '{vendor_name}' is NOT in db_tags.yaml. Skipping.")
-            
+            warnings["missing", tag, vendor_name] += 1
+
     if valid_canonicals:
         new_tags.extend(valid_canonicals)
         tx["category"] = new_tags
-        updated_count += 1
-    else:
-        print(f"No mapping found for '{vendor_name}', keeping original tags: {tx['category']}")
+        return True
+    warnings["unmapped", None, vendor_name] += 1
+    return False
+
+
+def migrate_chunk(chunk):
+    """Returns (migrated chunk, updated count, warning Counter)."""
+    warnings = Counter()
+    updated = 0
+    for tx in chunk:
+        if migrate_transaction(tx, warnings):
+            updated += 1
+    return chunk, updated, warnings
+
+
+def iter_chunks(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def migrate_chunks(chunks, allowed_tag_names, workers):
+    """Yields migrate_chunk results in input order.
+
+    With several workers at most 2 * workers chunks are in flight, so the
+    reader never runs far ahead of the writer.
+    """
+    if workers <= 1:
+        init_worker(allowed_tag_names, MAPPINGS)
+        yield from map(migrate_chunk, chunks)
+        return
+    with ProcessPoolExecutor(workers, initializer=init_worker,
+                             initargs=(allowed_tag_names, MAPPINGS)) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(migrate_chunk, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def migrate_records(records, allowed_tag_names, totals, workers=1, chunk_size=1000):
+    # Generator stage: records stream through in chunks, and come out in order
+    for chunk, updated, warnings in migrate_chunks(iter_chunks(records, chunk_size),
+                                                   allowed_tag_names, workers):
+        totals["updated"] += updated
+        totals["warnings"].update(warnings)
+        yield from chunk
+
+
+def print_warning_summary(warnings):
+    missing = {}
+    unmapped = Counter()
+    for (kind, tag, vendor), count in warnings.items():
+        if kind == "missing":
+            missing.setdefault(tag, Counter())[vendor] += count
+        else:
+            unmapped[vendor] += count
+
+    for tag, vendors in sorted(missing.items()):
+        print(f"Warning: mapped tag '{tag}' is NOT in db_tags.json. "
+              f"Skipped for {sum(vendors.values())} transactions:")
+        print_vendor_counts(vendors)
+    if unmapped:
+        print(f"No mapping found for {sum(unmapped.values())} transactions "
+              f"({len(unmapped)} vendors), keeping original tags:")
+        print_vendor_counts(unmapped)
+
+
+def print_vendor_counts(vendors):
+    for vendor, count in vendors.most_common(SUMMARY_LIMIT):
+        print(f" - {vendor!r}: {count}")
+    if len(vendors) > SUMMARY_LIMIT:
+        print(f" ... and {len(vendors) - SUMMARY_LIMIT} more vendors")
+
+
+def load_allowed_tags(db_path=DB_TAGS_PATH):
+    """{name: canonical name} for every tag and alias in db_tags.json.
+
+    Raises FileNotFoundError if the DB is missing. load_tag_db keeps the
+    parsed DB, so a long-lived process only re-reads it after the file changes.
+    """
+    db = load_tag_db(db_path)
+    return {**{name: name for name in db.names}, **db.aliases}
+
+
+def migrate_file(path, allowed_tag_names, data_format="auto", workers=1, chunk_size=1000):
+    """Migrates the transactions file at `path` in place.
+
+    Returns {"updated": count, "warnings": Counter} (see migrate_transaction).
+    """
+    if data_format == "auto":
+        data_format = detect_format(path)
+    totals = {"updated": 0, "warnings": Counter()}
+    records = migrate_records(iter_records(path, data_format), allowed_tag_names,
+                              totals, workers, max(1, chunk_size))
+    rewrite_records(path, records, data_format)
+    return totals
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Rewrite transaction categories to canonical db_tags names")
+    parser.add_argument("path", nargs="?", default=MOCK_DATA_PATH,
+                        help="Transactions file: a JSON array or JSON Lines (default: mock_transactions.json)")
+    parser.add_argument("--db", default=DB_TAGS_PATH, help=f"Path to db_tags.json (default: {DB_TAGS_PATH})")
+    parser.add_argument("--format", choices=["auto", "array", "jsonl"], default="auto",
+                        help="Input/output format (default: from the suffix or first byte)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Worker processes; 0 means one per CPU (default: 1, in-process)")
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help="Transactions per worker task (default: 1000)")
+    args = parser.parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+
+    # 1. Load Allowable Tags
+    db_path = os.path.abspath(args.db)
+    if not os.path.exists(db_path):
+        print("Error: db_tags.json not found!")
+        return 1
+    print(f"Loading tags from {db_path}...")
+    allowed_tag_names = load_allowed_tags(db_path)
+
+    aliases = sum(name != canonical for name, canonical in allowed_tag_names.items())
+    print(f"Loaded {len(allowed_tag_names) - aliases} valid canonical tags."
+          + (f" ({aliases} older names resolve through aliases)" if aliases else ""))
+
+    # 2. Stream: read incrementally, migrate in chunks, write to a temp file
+    #    and rename it over the input
+    data_format = detect_format(args.path) if args.format == "auto" else args.format
+    print(f"Processing {args.path} ({data_format}, {workers} worker{'s' if workers != 1 else ''})...")
+    totals = migrate_file(args.path, allowed_tag_names, data_format, workers, args.chunk_size)
+
+    print_warning_summary(totals["warnings"])
+    print(f"Migration complete. Updated {totals['updated']} transactions.")
+    return 0
 
-# 4. Save
-with open(MOCK_DATA_PATH, "w") as f:
-    json.dump(transactions, f, indent=4)
 
-print(f"Migration complete. Updated {updated_count} transactions.")
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""Suggests a tag's related markets from similar, already-related tags.
+
+The generator asks the AI for the markets of every Vendor/Service tag that
+is not in the relations cache, although the MARKETS descriptions and the
+tags that already have relations are a labelled corpus. Each tag is a
+TF-IDF vector over the words and character 3-grams of its name and
+description (sparse dicts, with an inverted index from feature to tags), and
+a query's markets are a similarity-weighted vote of its nearest labelled
+tags. When the neighbours agree, the vote is the answer and the AI is not
+asked; `confidence` says how much they agree.
+
+    python -m tooling.related_index    # leave-one-out agreement with the relations cache
+"""
+import argparse
+import heapq
+import json
+import math
+import re
+import sys
+from collections import Counter
+from operator import itemgetter
+
+from .tag_db import DEFAULT_DB_PATH, load_tag_db
+
+_WORD = re.compile(r"[a-z0-9]+")
+# Below this confidence the AI is asked (see evaluate() for the trade-off)
+DEFAULT_MIN_CONFIDENCE = 0.3
+
+
+def features(text):
+    """Counter of the words and padded character 3-grams of `text`."""
+    words = _WORD.findall(text.lower())
+    counts = Counter("w:" + w for w in words)
+    for w in words:
+        padded = f" {w} "
+        counts.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return counts
+
+
+def tag_text(tag):
+    return f"{tag['name']} {tag.get('description', '')}"
+
+
+class RelatedIndex:
+    """Nearest-neighbour index over labelled texts.
+
+    `labelled` is [(text, related names)]; names outside `market_names` are
+    ignored, and an empty list is a label too ("no market applies").
+    """
+
+    def __init__(self, labelled, market_names, k=10, min_share=0.5):
+        self.market_names = frozenset(market_names)
+        self.k = k
+        self.min_share = min_share
+        self.texts = [text for text, _ in labelled]
+        self.labels = [frozenset(r for r in related if r in self.market_names) for _, related in labelled]
+        docs = [features(text) for text, _ in labelled]
+        df = Counter(f for doc in docs for f in doc)
+        self.idf = {f: math.log((1 + len(docs)) / (1 + n)) + 1 for f, n in df.items()}
+        self.postings = {}
+        for i, doc in enumerate(docs):
+            for f, w in self._vector(doc).items():
+                self.postings.setdefault(f, []).append((i, w))
+
+    @classmethod
+    def from_tags(cls, tags, relations, market_tags, **kwargs):
+        """Markets label themselves; `relations` maps tag name -> related markets."""
+        labelled = [(tag_text(m), [m["name"]]) for m in market_tags]
+        labelled.extend((tag_text(tag), relations[tag["name"]]) for tag in tags if tag["name"] in relations)
+        return cls(labelled, [m["name"] for m in market_tags], **kwargs)
+
+    def _vector(self, counts):
+        # Sublinear tf x idf, L2-normalised; features no labelled text has are dropped
+        vec = {f: (1 + math.log(n)) * self.idf[f] for f, n in counts.items() if f in self.idf}
+        norm = math.sqrt(sum(w * w for w in vec.values())) or 1.0
+        return {f: w / norm for f, w in vec.items()}
+
+    def neighbours(self, text, exclude=None):
+        """[(labelled index, cosine similarity)] of the k nearest, best first."""
+        scores = {}
+        for f, qw in self._vector(features(text)).items():
+            for i, w in self.postings.get(f, ()):
+                scores[i] = scores.get(i, 0.0) + qw * w
+        scores.pop(exclude, None)
+        return heapq.nlargest(self.k, scores.items(), key=itemgetter(1))
+
+    def suggest(self, text, exclude=None):
+        """(related markets, confidence in [0, 1]).
+
+        A market is related when neighbours holding at least `min_share` of
+        the similarity list it. Confidence is the share held by neighbours
+        whose label is exactly that answer, times the nearest similarity.
+        """
+        hits = self.neighbours(text, exclude)
+        total = sum(s for _, s in hits)
+        if not total:
+            return [], 0.0
+        votes = Counter()
+        for i, s in hits:
+            votes.update(dict.fromkeys(self.labels[i], s))
+        related = [m for m, v in votes.most_common() if v / total >= self.min_share]
+        answer = frozenset(related)
+        agreeing = sum(s for i, s in hits if self.labels[i] == answer)
+        return related, agreeing / total * hits[0][1]
+
+
+def evaluate(index, min_confidence=DEFAULT_MIN_CONFIDENCE, skip=0):
+    """Leave-one-out over the labelled texts after the first `skip` (the markets).
+
+    Returns coverage (answered without the AI), exact agreement and mean
+    Jaccard on the answered ones, and exact agreement if everything were answered.
+    """
+    answered = exact = exact_all = 0
+    jaccard = 0.0
+    total = len(index.labels) - skip
+    for i in range(skip, len(index.labels)):
+        related, confidence = index.suggest(index.texts[i], exclude=i)
+        expected = index.labels[i]
+        same = frozenset(related) == expected
+        exact_all += same
+        if confidence >= min_confidence:
+            answered += 1
+            exact += same
+            union = expected | set(related)
+            jaccard += len(expected & set(related)) / len(union) if union else 1.0
+    return {
+        "tags": total,
+        "answered_locally": answered,
+        "ai_calls_avoided": answered,
+        "coverage": round(answered / total, 4) if total else None,
+        "exact_agreement": round(exact / answered, 4) if answered else None,
+        "mean_jaccard": round(jaccard / answered, 4) if answered else None,
+        "exact_agreement_if_all_answered": round(exact_all / total, 4) if total else None,
+    }
+
+
+def main(argv=None, prog=None):
+    from .generate_tags_db import MARKETS, RELATIONS_CACHE_FILE
+
+    parser = argparse.ArgumentParser(prog=prog, description="Leave-one-out check of local related-market suggestions")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="db_tags.json (for tag descriptions)")
+    parser.add_argument("--relations", default=RELATIONS_CACHE_FILE,
+                        help=f"Relations to compare against (default: {RELATIONS_CACHE_FILE})")
+    parser.add_argument("--min-confidence", type=float, nargs="+", default=[DEFAULT_MIN_CONFIDENCE],
+                        help="Confidence threshold(s) to report")
+    args = parser.parse_args(argv)
+
+    try:
+        db = load_tag_db(args.db)
+        with open(args.relations, "r", encoding="utf-8") as f:
+            relations = json.load(f)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return 1
+    tags = [tag for tag in db.tags if tag.get("type") in ("Vendor", "Service")]
+    tags = list({tag["name"]: tag for tag in tags}.values())
+    index = RelatedIndex.from_tags(tags, relations, MARKETS)
+    for threshold in args.min_confidence:
+        print(json.dumps(dict(min_confidence=threshold, **evaluate(index, threshold, skip=len(MARKETS)))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""Timings and counters for one tooling run, summarised as JSON.
+
+    metrics = RunMetrics()
+    with metrics.stage("naming_pass"):
+        ...
+    metrics.count("naming_pass.ai_calls", 12)
+    print(json.dumps(metrics.summary(), indent=2))
+
+Stages record wall time (perf_counter) and CPU time (process_time) of the
+calling process; a stage entered twice accumulates.
+"""
+import bisect
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def latency_histogram(latencies, buckets=LATENCY_BUCKETS):
+    """Count, mean, p50/p95/max and per-bucket counts for `latencies` (seconds)."""
+    latencies = sorted(latencies)
+    counts = [0] * (len(buckets) + 1)
+    for value in latencies:
+        counts[bisect.bisect_left(buckets, value)] += 1
+    labels = [f"<={b:g}s" for b in buckets] + [f">{buckets[-1]:g}s"]
+    summary = {"count": len(latencies), "buckets": dict(zip(labels, counts))}
+    if latencies:
+        summary.update({
+            "mean_s": round(sum(latencies) / len(latencies), 4),
+            "p50_s": round(latencies[len(latencies) // 2], 4),
+            "p95_s": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4),
+            "max_s": round(latencies[-1], 4),
+        })
+    return summary
+
+
+class RunMetrics:
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.bytes_written = {}
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    @contextmanager
+    def stage(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            timing = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0})
+            timing["wall_s"] += time.perf_counter() - wall
+            timing["cpu_s"] += time.process_time() - cpu
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def wrote(self, path, size):
+        self.bytes_written[path] = self.bytes_written.get(path, 0) + size
+
+    def summary(self, **sections):
+        """The run so far as a JSON-ready dict; `sections` are added as-is."""
+        stages = {name: {k: round(v, 4) for k, v in timing.items()} for name, timing in self.stages.items()}
+        result = {
+            "wall_s": round(time.perf_counter() - self._wall_start, 4),
+            "cpu_s": round(time.process_time() - self._cpu_start, 4),
+            "stages": stages,
+            "counters": dict(self.counters),
+            "bytes_written": {"total": sum(self.bytes_written.values()), "files": dict(self.bytes_written)},
+        }
+        result.update(sections)
+        return result
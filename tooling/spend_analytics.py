@@ -0,0 +1,292 @@
+"""Per-tag spend totals and budget windows over tagged transactions.
+
+Implements the "Tagged Budgets" / "Tagged Reports" rules of docs/tagging.md
+and docs/datamodel.md: a budget is a limit plus a frequency in days (0 is
+the calendar month), each month is cut into frequency-sized periods with a
+short remainder merged into the last one, and a period's limit is pro-rated
+by its length. The period rules mirror BudgetService.calculatePeriods in
+packages/budgetizer_dart.
+
+Transactions are loaded into columns: `days` (date ordinals) and `amounts`
+(float64) as arrays, and the tag lists as CSR arrays over the distinct tag
+sets (`set_ids` per transaction -> `set_offsets` / `set_tags`), since most
+transactions repeat a vendor's tag list. Analysis then sums spend per
+(tag set, day) pair that occurs: with NumPy (the optional "spend" extra)
+by np.unique/np.bincount over a combined set_id * n_days + day key, else
+in one pass over the transactions into a {day: spend} dict per tag set.
+Either way memory grows with the pairs that occur, not tag sets x days,
+and totals and windows are read off the sums, so their cost depends on the
+number of tag sets and days, not transactions.
+
+    budgetizer-tools spend sandbox_transactions.yaml --budget Dining=100/7
+"""
+import argparse
+import calendar
+import json
+import sys
+import time
+from array import array
+from collections import Counter
+from datetime import date
+from itertools import accumulate
+
+from .transactions import iter_transactions
+
+
+def tags_of(tx):
+    # Sandbox exports use "tags"; mock_transactions.json uses "category"
+    return tx.get("tags") or tx.get("category") or ()
+
+
+class SpendColumns:
+    """Columnar transactions: see the module docstring for the layout."""
+
+    def __init__(self):
+        self.days = array("l")
+        self.amounts = array("d")
+        self.set_ids = array("l")
+        self.set_offsets = array("l", [0])
+        self.set_tags = array("l")
+        self.tag_names = []
+        self.tag_index = {}
+
+    def __len__(self):
+        return len(self.days)
+
+    @classmethod
+    def from_records(cls, records):
+        cols = cls()
+        days_append = cols.days.append
+        amounts_append = cols.amounts.append
+        set_ids_append = cols.set_ids.append
+        ordinals = {}
+        set_index = {}
+        for tx in records:
+            raw_date = tx["date"]
+            day = ordinals.get(raw_date)
+            if day is None:
+                day = ordinals[raw_date] = date.fromisoformat(raw_date).toordinal()
+            tags = tuple(tags_of(tx))
+            set_id = set_index.get(tags)
+            if set_id is None:
+                set_id = set_index[tags] = cols._add_tag_set(tags)
+            days_append(day)
+            amounts_append(float(tx["amount"]))
+            set_ids_append(set_id)
+        return cols
+
+    def _add_tag_set(self, tags):
+        for name in dict.fromkeys(tags):
+            tag_id = self.tag_index.get(name)
+            if tag_id is None:
+                tag_id = self.tag_index[name] = len(self.tag_names)
+                self.tag_names.append(name)
+            self.set_tags.append(tag_id)
+        self.set_offsets.append(len(self.set_tags))
+        return len(self.set_offsets) - 2
+
+    def tags_in_set(self, set_id):
+        return self.set_tags[self.set_offsets[set_id]:self.set_offsets[set_id + 1]]
+
+
+def parse_budget(spec):
+    """"Groceries=100/7" -> ("Groceries", 100.0, 7); the frequency defaults to 0 (monthly)."""
+    name, sep, rest = spec.rpartition("=")
+    if not sep or not name:
+        raise ValueError(f"Budget must look like TAG=LIMIT[/DAYS]: {spec!r}")
+    limit, _, frequency = rest.partition("/")
+    return name, float(limit), int(frequency or 0)
+
+
+def budget_periods(year, month, frequency, limit):
+    """[(first day, last day, pro-rated limit)] for one month, as in BudgetService."""
+    days_in_month = calendar.monthrange(year, month)[1]
+    if frequency <= 0:
+        return [(1, days_in_month, limit)]
+    periods = []
+    current = 1
+    while current <= days_in_month:
+        end = current + frequency - 1
+        # A remainder shorter than half a period is merged into this one
+        if end >= days_in_month or days_in_month - end < frequency / 2.0:
+            end = days_in_month
+        periods.append((current, end, (end - current + 1) / frequency * limit))
+        current = end + 1
+    return periods
+
+
+def iter_months(first_day, last_day):
+    first, last = date.fromordinal(first_day), date.fromordinal(last_day)
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class SetSpend:
+    """Spend per (tag set, day), summed in one pass over the transactions.
+
+    Each tag set keeps a {day: spend} dict, so memory grows with the (tag
+    set, day) pairs that occur, not tag sets x days.
+    """
+
+    engine = "python"
+
+    def __init__(self, cols, first_day, n_days):
+        self.first_day = first_day
+        self.n_days = n_days
+        self.by_set = [{} for _ in range(len(cols.set_offsets) - 1)]
+        for set_id, day, amount in zip(cols.set_ids, cols.days, cols.amounts):
+            spend = self.by_set[set_id]
+            spend[day] = spend.get(day, 0.0) + amount
+        set_counts = Counter(cols.set_ids)
+        self.totals = [sum(spend.values()) for spend in self.by_set]
+        self.counts = [set_counts[set_id] for set_id in range(len(self.by_set))]
+
+    def daily(self, set_ids):
+        """Spend per day (from first_day) over the tag sets `set_ids`."""
+        daily = [0.0] * self.n_days
+        for set_id in set_ids:
+            for day, amount in self.by_set[set_id].items():
+                daily[day - self.first_day] += amount
+        return daily
+
+
+class NumpySetSpend:
+    """SetSpend over NumPy: the transactions are grouped by a combined
+    set_id * n_days + day key with np.unique and summed with np.bincount."""
+
+    engine = "numpy"
+
+    def __init__(self, cols, first_day, n_days, np):
+        self.np = np
+        self.n_days = n_days
+        n_sets = len(cols.set_offsets) - 1
+        set_ids = np.frombuffer(cols.set_ids, dtype=cols.set_ids.typecode).astype(np.int64)
+        days = np.frombuffer(cols.days, dtype=cols.days.typecode) - first_day
+        amounts = np.frombuffer(cols.amounts, dtype=np.float64)
+        keys, cells = np.unique(set_ids * n_days + days, return_inverse=True)
+        self.cell_spend = np.bincount(cells, weights=amounts)
+        self.cell_set, self.cell_day = np.divmod(keys, n_days)
+        self.totals = np.bincount(set_ids, weights=amounts, minlength=n_sets).tolist()
+        self.counts = np.bincount(set_ids, minlength=n_sets).tolist()
+
+    def daily(self, set_ids):
+        np = self.np
+        cells = np.isin(self.cell_set, np.fromiter(set_ids, dtype=np.int64))
+        return np.bincount(self.cell_day[cells], weights=self.cell_spend[cells], minlength=self.n_days).tolist()
+
+
+def set_spend(cols, first_day, n_days, use_numpy=None):
+    """NumpySetSpend when NumPy is installed (or `use_numpy`), else SetSpend."""
+    if use_numpy is not False:
+        try:
+            import numpy  # Optional (the "spend" extra); imported only for an analysis
+        except ImportError:
+            if use_numpy:
+                raise
+        else:
+            return NumpySetSpend(cols, first_day, n_days, numpy)
+    return SetSpend(cols, first_day, n_days)
+
+
+class SpendReport:
+    """totals / counts: per tag name. windows: one dict per budget period,
+    over-budget periods first (docs/tagging.md puts them at the top).
+
+    `use_numpy` None picks NumPy when it is installed; False forces the
+    stdlib path.
+    """
+
+    def __init__(self, cols, budgets=(), use_numpy=None):
+        self.totals = {}
+        self.counts = {}
+        self.windows = []
+        self.engine = None
+        if not len(cols):
+            return
+
+        first_day = min(cols.days)
+        n_days = max(cols.days) - first_day + 1
+        spend = set_spend(cols, first_day, n_days, use_numpy)
+        self.engine = spend.engine
+
+        sets_with_tag = {}
+        for set_id, (total, count) in enumerate(zip(spend.totals, spend.counts)):
+            for tag_id in cols.tags_in_set(set_id):
+                name = cols.tag_names[tag_id]
+                self.totals[name] = self.totals.get(name, 0.0) + total
+                self.counts[name] = self.counts.get(name, 0) + count
+                sets_with_tag.setdefault(name, []).append(set_id)
+
+        months = list(iter_months(first_day, first_day + n_days - 1))
+        for name, limit, frequency in budgets:
+            spent_before = list(accumulate(spend.daily(sets_with_tag.get(name, ())), initial=0.0))
+            for year, month in months:
+                month_start = date(year, month, 1).toordinal()
+                for first, last, period_limit in budget_periods(year, month, frequency, limit):
+                    lo = min(max(month_start + first - 1 - first_day, 0), n_days)
+                    hi = min(max(month_start + last - first_day, 0), n_days)
+                    spent = spent_before[hi] - spent_before[lo]
+                    self.windows.append({
+                        "tag": name,
+                        "start": date.fromordinal(month_start + first - 1).isoformat(),
+                        "end": date.fromordinal(month_start + last - 1).isoformat(),
+                        "limit": round(period_limit, 2),
+                        "spent": round(spent, 2),
+                        "remaining": round(period_limit - spent, 2),
+                        "over": spent > period_limit,
+                    })
+        self.windows.sort(key=lambda w: not w["over"])
+
+    def to_dict(self):
+        return {
+            "totals": {name: round(total, 2) for name, total in
+                       sorted(self.totals.items(), key=lambda item: -abs(item[1]))},
+            "counts": self.counts,
+            "windows": self.windows,
+        }
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Per-tag spend totals and budget windows")
+    parser.add_argument("transactions", help="Transactions file (.json, .jsonl or .yaml)")
+    parser.add_argument("--budget", action="append", default=[], metavar="TAG=LIMIT[/DAYS]",
+                        help="Budget for a tag; DAYS is the frequency, 0 or omitted for monthly. Repeatable.")
+    parser.add_argument("--top", type=int, default=20, help="Tags to list by total (default: 20)")
+    parser.add_argument("--json", action="store_true", help="Print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        budgets = [parse_budget(spec) for spec in args.budget]
+    except ValueError as e:
+        parser.error(str(e))
+
+    start = time.perf_counter()
+    try:
+        cols = SpendColumns.from_records(iter_transactions(args.transactions))
+    except FileNotFoundError:
+        print(f"Error: File not found at {args.transactions}")
+        return 1
+    loaded = time.perf_counter()
+    report = SpendReport(cols, budgets)
+    analysed = time.perf_counter()
+
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+        return 0
+    print(f"{len(cols)} transactions, {len(cols.tag_names)} tags, "
+          f"{len(cols.set_offsets) - 1} distinct tag sets")
+    for name, total in list(report.to_dict()["totals"].items())[:args.top]:
+        print(f"  {name:<30} {total:>12.2f}  ({report.counts[name]} tx)")
+    for w in report.windows:
+        flag = "OVER" if w["over"] else "ok"
+        print(f"  [{flag:>4}] {w['tag']} {w['start']}..{w['end']}: "
+              f"{w['spent']:.2f} of {w['limit']:.2f}")
+    print(f"Loaded in {(loaded - start) * 1000:.1f} ms, analysed in {(analysed - loaded) * 1000:.1f} ms "
+          f"({report.engine or 'nothing to analyse'})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
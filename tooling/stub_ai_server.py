@@ -0,0 +1,124 @@
+"""Local stand-in for the chat-completions endpoint.
+
+Lets the AI passes in generate_tags_db.py run offline:
+
+    python -m tooling.stub_ai_server --port 8765 --fail-rate 0.2
+    OPENAI_API_KEY=stub OPENAI_API_URL=http://127.0.0.1:8765/v1/chat/completions \
+        budgetizer-tools generate
+
+Replies are deterministic for a given prompt. `--fail-rate` answers a share
+of requests with 429 (with a `--retry-after` header) so the retry path gets
+exercised, `--partial-rate` drops entries from batched replies, and
+`--latency` adds a fixed delay per request. The handler counts requests and
+the most it had in flight at once.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def stub_name(description):
+    return " ".join(re.split(r"[,;(]", description)[0].split()[:2])
+
+
+def stub_reply(prompt, partial_rate=0.0):
+    """Builds a plausible answer for the prompts generate_tags_db.py sends.
+
+    Batched prompts get a JSON array back; `partial_rate` drops that share of
+    the entries so the per-item fallback gets exercised.
+    """
+    if "select related Markets" in prompt:
+        # Pick the first candidate market, so relations are non-empty but stable.
+        match = re.search(r"from \[(.*?)\]", prompt)
+        candidates = re.findall(r"'([^']+)'", match.group(1)) if match else []
+        if "Entities:" in prompt:
+            entities = json.loads(prompt.rsplit("Entities:", 1)[-1])
+            return json.dumps([{"tag": e["tag"], "identity": "stub", "related": candidates[:1]}
+                               for e in entities if random.random() >= partial_rate])
+        return json.dumps({"identity": "stub", "related": candidates[:1]})
+    if "Items:" in prompt:
+        items = json.loads(prompt.rsplit("Items:", 1)[-1])
+        return json.dumps([{"mcc_id": i["mcc_id"], "name": stub_name(i["description"])}
+                           for i in items if random.random() >= partial_rate])
+    return stub_name(prompt.rsplit("Description:", 1)[-1].strip())
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    fail_rate = 0.0
+    partial_rate = 0.0
+    retry_after = 0.0
+    requests = 0
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        with StubHandler.lock:
+            StubHandler.requests += 1
+            StubHandler.in_flight += 1
+            StubHandler.max_in_flight = max(StubHandler.max_in_flight, StubHandler.in_flight)
+        try:
+            self.answer(json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and hung up
+        finally:
+            with StubHandler.lock:
+                StubHandler.in_flight -= 1
+
+    def answer(self, body):
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            self.send_response(429)
+            self.send_header("Retry-After", f"{self.retry_after:g}")
+            self.end_headers()
+            return
+        content = stub_reply(body["messages"][0]["content"], self.partial_rate)
+        payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=0, latency=0.0, fail_rate=0.0, partial_rate=0.0, retry_after=0.0):
+    """Starts the stub on a background thread and returns the server.
+
+    The request counters on StubHandler start again from zero.
+    """
+    StubHandler.latency = latency
+    StubHandler.fail_rate = fail_rate
+    StubHandler.partial_rate = partial_rate
+    StubHandler.retry_after = retry_after
+    StubHandler.requests = StubHandler.in_flight = StubHandler.max_in_flight = 0
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--partial-rate", type=float, default=0.0,
+                        help="Share of entries dropped from batched replies")
+    parser.add_argument("--retry-after", type=float, default=0.0, help="Retry-After seconds sent with a 429")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.fail_rate, args.partial_rate, args.retry_after)
+    print(f"Stub AI endpoint on http://127.0.0.1:{server.server_address[1]}/v1/chat/completions")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
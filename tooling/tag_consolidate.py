@@ -0,0 +1,188 @@
+"""Merges duplicate and near-duplicate tags into one canonical tag.
+
+The generator's tag sources overlap: "Fast Food" is both a Market and a
+Service, several MCC codes share a name ("Contractors"), "Gift" sits next
+to "Gifts" and "CVS/Pharmacy" next to "CVS Pharmacy". Every name is
+reduced to a key (case, punctuation, "and"/"the" and plural endings
+dropped), tags with the same key are one cluster, and keys one inserted
+or deleted character apart are joined too ("Printing" and "Painting", one
+substitution apart, stay separate). Candidate pairs for that check come
+from blocking on the keys' single-character deletions (the shorter key is
+always one of the longer key's), so the cost grows with the number of
+tags, never tags x tags.
+
+The first tag of a cluster (in DB order: Vendors, Markets, System,
+Manual, MCC) is the canonical one. It takes the cluster's MCC codes
+(`mcc_ids`, when there is more than one), related names and vendor
+patterns; every `related` list is rewritten to canonical names, and the
+dropped names go into an alias map so they still resolve.
+
+    python -m tooling.tag_consolidate    # lists the clusters in db_tags.json
+"""
+import argparse
+import re
+import sys
+
+from .tag_db import DEFAULT_DB_PATH, load_tag_db, mcc_codes
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(["and", "the"])
+_INLINE_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+# Shorter keys only merge when they are equal ("Gas" and "Tax" stay apart)
+MIN_FUZZY_LENGTH = 8
+
+
+def singular(word):
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def name_key(name):
+    """The comparison key of a tag name: "CVS/Pharmacy" and "CVS Pharmacies" -> "cvspharmacy"."""
+    words = _WORD.findall(name.casefold().replace("&", " and "))
+    return "".join(singular(w) for w in words if w not in STOP_WORDS)
+
+
+def deletions(key):
+    """`key` and every string one character shorter than it."""
+    return {key, *(key[:i] + key[i + 1:] for i in range(len(key)))}
+
+
+def one_edit_apart(a, b):
+    """True when inserting or deleting one character turns `a` into `b`.
+
+    Substitutions do not count: they join unrelated words of the same
+    shape ("Printing" and "Painting").
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) != 1:
+        return False
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1:]
+
+
+def cluster_names(names, min_length=MIN_FUZZY_LENGTH):
+    """Groups of `names` that are duplicates; each group keeps the input order.
+
+    Names with equal keys are grouped outright, and keys of at least
+    `min_length` characters one insertion or deletion apart join their groups.
+    """
+    by_key = {}
+    for i, name in enumerate(names):
+        by_key.setdefault(name_key(name), []).append(i)
+
+    parent = {key: key for key in by_key}
+
+    def find(key):
+        while parent[key] != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    blocks = {}
+    for key in by_key:
+        if len(key) >= min_length:
+            for variant in deletions(key):
+                blocks.setdefault(variant, []).append(key)
+    for block in blocks.values():
+        for i, a in enumerate(block):
+            for b in block[i + 1:]:
+                if find(a) != find(b) and one_edit_apart(a, b):
+                    parent[find(b)] = find(a)
+
+    groups = {}
+    for key, indexes in by_key.items():
+        groups.setdefault(find(key), []).extend(indexes)
+    return [sorted(indexes) for indexes in groups.values()]
+
+
+def split_flags(regex):
+    """(leading inline flags, rest): "(?i)UBER" -> ("i", "UBER")."""
+    m = _INLINE_FLAGS.match(regex)
+    return (m.group(1), regex[m.end():]) if m else ("", regex)
+
+
+def merge_regex(regex, other):
+    """A regex matching what either vendor regex matches.
+
+    Inline flags must lead a pattern, so they are taken off both sides: shared
+    flags lead the result, differing ones are scoped to their own side.
+    """
+    if not regex or regex == other:
+        return other or regex
+    if not other:
+        return regex
+    flags, body = split_flags(regex)
+    other_flags, other_body = split_flags(other)
+    if flags == other_flags:
+        return (f"(?{flags})" if flags else "") + f"{body}|{other_body}"
+    return f"(?{flags}:{body})|(?{other_flags}:{other_body})"
+
+
+def consolidate(tags, min_length=MIN_FUZZY_LENGTH):
+    """Returns (tags, aliases, merged).
+
+    `tags` is a new list with one tag per cluster, in the order of the
+    canonical tags; `aliases` maps every dropped name to its canonical name;
+    `merged` is [(canonical index, [dropped indexes])] into the input list.
+    The input tags are not modified.
+    """
+    groups = sorted(cluster_names([tag["name"] for tag in tags], min_length))
+    aliases = {}
+    for group in groups:
+        name = tags[group[0]]["name"]
+        for i in group[1:]:
+            if tags[i]["name"] != name:
+                aliases.setdefault(tags[i]["name"], name)
+
+    consolidated = []
+    merged = []
+    for group in groups:
+        members = [tags[i] for i in group]
+        tag = dict(members[0])
+        name = tag["name"]
+        codes = list(dict.fromkeys(code for member in members for code in mcc_codes(member)))
+        if codes:
+            tag["mcc_id"] = tag.get("mcc_id") or codes[0]
+            if len(codes) > 1:
+                tag["mcc_ids"] = codes
+        for member in members[1:]:
+            if member.get("regex"):
+                tag["regex"] = merge_regex(tag.get("regex"), member["regex"])
+        if any("related" in member for member in members):
+            related = (aliases.get(r, r) for member in members for r in member.get("related", ()))
+            tag["related"] = [r for r in dict.fromkeys(related) if r != name]
+        consolidated.append(tag)
+        if len(group) > 1:
+            merged.append((group[0], group[1:]))
+    return consolidated, dict(sorted(aliases.items())), merged
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="List duplicate and near-duplicate tags")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to db_tags.json")
+    parser.add_argument("--min-length", type=int, default=MIN_FUZZY_LENGTH,
+                        help=f"Shortest key merged with a key one inserted or deleted character away (default: {MIN_FUZZY_LENGTH})")
+    args = parser.parse_args(argv)
+
+    try:
+        db = load_tag_db(args.db)
+    except FileNotFoundError:
+        print(f"Error: File not found at {args.db}")
+        return 1
+    tags, aliases, merged = consolidate(db.tags, args.min_length)
+    for canonical, dropped in merged:
+        print(f"{db.tags[canonical]['name']!r} <- "
+              + ", ".join(f"{db.tags[i]['name']!r} ({db.tags[i].get('type')})" for i in dropped))
+    print(f"{len(db.tags)} tags -> {len(tags)} after consolidation ({len(aliases)} aliases)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
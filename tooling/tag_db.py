@@ -0,0 +1,447 @@
+"""Shared reader and writer for the tag DB (db_tags.json / db_tags.yaml).
+
+generate_tags_db.py writes through this module and every other tool reads
+through it, so the on-disk format lives in one place.
+
+load_tag_db() parses the canonical JSON once and builds name, type and mcc
+indexes, plus the alias map of names merged into another tag (resolve()). The result is kept in memory and in a pickle snapshot under
+tooling/.cache, both keyed on the JSON's mtime and size, so repeated tool
+invocations skip the JSON parse until the DB is regenerated.
+
+The generator also writes db_tags.bin, a compact binary copy that
+BinaryTagDB reads through a memory map without parsing (format below).
+
+    python -m tooling.tag_db [DB_JSON]    # checks db_tags.bin against db_tags.json
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import re
+import struct
+import sys
+import tempfile
+from array import array
+
+from .yaml_emitter import emit_tags
+
+# The app's tag DB, relative to the repository root. Every tool defaults to it, and
+# the generator writes it (under --base-dir) unless given --output-dir.
+DEFAULT_DB_DIR = os.path.join("apps", "desktop", "assets", "data")
+DEFAULT_DB_PATH = os.path.join(DEFAULT_DB_DIR, "db_tags.json")
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+# Bump when TagDB's attributes change so stale snapshots are re-parsed
+SNAPSHOT_VERSION = 2
+
+_loaded = {}
+
+
+def mcc_codes(tag):
+    """The MCC codes of `tag`: `mcc_ids` on a tag that absorbed others, else its `mcc_id`."""
+    if tag.get("mcc_ids"):
+        return [str(code) for code in tag["mcc_ids"]]
+    return [str(tag["mcc_id"])] if tag.get("mcc_id") else []
+
+
+class TagDB:
+    def __init__(self, tags, related_closure=None, aliases=None):
+        self.tags = tags
+        self.related_closure = related_closure
+        self.aliases = aliases or {}
+        self.by_name = {}
+        self.by_type = {}
+        self.by_mcc = {}
+        for tag in tags:
+            self.by_name.setdefault(tag["name"], []).append(tag)
+            self.by_type.setdefault(tag.get("type"), []).append(tag)
+            for code in mcc_codes(tag):
+                self.by_mcc.setdefault(code, []).append(tag)
+
+    @property
+    def names(self):
+        return self.by_name.keys()
+
+    def resolve(self, name):
+        """The tag name `name` refers to now: the canonical name for an alias, else `name`."""
+        return self.aliases.get(name, name)
+
+    def __len__(self):
+        return len(self.tags)
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def snapshot_path(path):
+    digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(SNAPSHOT_DIR, f"tag_db-{digest}.pickle")
+
+
+def _read_snapshot(path, stamp):
+    try:
+        with open(snapshot_path(path), "rb") as f:
+            version, source_stamp, db = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError, ValueError, TypeError):
+        return None
+    if version != SNAPSHOT_VERSION or source_stamp != stamp:
+        return None
+    return db
+
+
+def _write_snapshot(path, stamp, db):
+    # Best effort: a read-only checkout just re-parses next time
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump((SNAPSHOT_VERSION, stamp, db), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path(path))
+    except OSError as e:
+        print(f"Warning: Could not write tag DB snapshot: {e}")
+
+
+def load_tag_db(path=DEFAULT_DB_PATH, use_snapshot=True):
+    """Returns the TagDB for `path`, re-parsing only when the file changed.
+
+    Raises FileNotFoundError if the DB does not exist.
+    """
+    key = os.path.abspath(path)
+    stamp = _stamp(path)
+    cached = _loaded.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+
+    db = _read_snapshot(path, stamp) if use_snapshot else None
+    if db is None:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        db = TagDB(data["tags"], data.get("related_closure"), data.get("aliases"))
+        if use_snapshot:
+            _write_snapshot(path, stamp, db)
+    _loaded[key] = (stamp, db)
+    return db
+
+
+# Writers
+
+def to_yaml(tags):
+    """db_tags.yaml text (see yaml_emitter; no pyyaml dependency)."""
+    return emit_tags(tags)
+
+
+def to_json(tags, related_closure=None, aliases=None):
+    """db_tags.json text.
+
+    Tags and aliases stay pretty-printed for diffs; the closure arrays go on one line.
+    """
+    data = {"tags": tags}
+    if aliases:
+        data["aliases"] = aliases
+    text = json.dumps(data, indent=2)
+    if related_closure is None:
+        return text
+    return text[:-2] + ',\n  "related_closure": ' + json.dumps(related_closure, separators=(",", ":")) + "\n}"
+
+
+# Vendors learned by the AI fallback (tooling/learned_vendors.json, see ai_fallback.py).
+# The generator merges them into its Vendor tags, so a rebuild keeps them.
+
+def vendor_regex(name, patterns=()):
+    """The `regex` of a Vendor tag: its name, or the name or any learned pattern."""
+    if not patterns:
+        return f"(?i){name}"
+    return "(?i)" + "|".join([re.escape(name), *patterns])
+
+
+def learned_vendor_tag(entry):
+    """The db_tags entry for a learned vendor that is not one of the generator's own."""
+    return {
+        "name": entry["name"],
+        "type": "Vendor",
+        "description": f"Vendor: {entry['name']}",
+        "regex": vendor_regex(entry["name"], entry.get("patterns", ())),
+        "source": "AI",
+        "related": list(entry.get("related", [])),
+    }
+
+
+def load_learned_vendors(path):
+    """[{"name", "patterns", "related", "examples"}], or [] when there is no file yet."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("vendors", [])
+    except FileNotFoundError:
+        return []
+
+
+def dump_learned_vendors(vendors):
+    return json.dumps({"version": 1, "vendors": vendors}, indent=2, ensure_ascii=False) + "\n"
+
+
+# Binary artifact (db_tags.bin)
+#
+# Little-endian. A 32-byte header, then u32 sections, then the string bytes:
+#   header          magic "BTAG", u16 version, u16 flags (1 = has closure),
+#                   u32 tags, strings, related, closure targets, string bytes, aliases
+#   string_offsets  strings + 1; string i is blob[offsets[i]:offsets[i + 1]] (UTF-8)
+#   records         tags x RECORD_FIELDS: string ids of name, type, description,
+#                   regex, source, mcc_id, mcc_ids (comma-joined), then
+#                   related offset, related length
+#   related         string ids of every tag's `related` names, back to back
+#   name_order      tag indexes sorted by UTF-8 name, for binary search
+#   closure         offsets (tags + 1) and targets, as in `related_closure`
+#   aliases         string ids of (alias, canonical name) pairs, sorted by alias
+#   blob            the interned strings
+# A string id of ABSENT means the key is missing, NULL means JSON null; a
+# related offset of ABSENT means the tag has no `related` key.
+
+BINARY_DB_PATH = os.path.splitext(DEFAULT_DB_PATH)[0] + ".bin"
+BINARY_MAGIC = b"BTAG"
+BINARY_VERSION = 3
+HAS_CLOSURE = 1
+ABSENT = 0xFFFFFFFF
+NULL = 0xFFFFFFFE
+_HEADER = struct.Struct("<4sHHIIIIII")
+STRING_FIELDS = ("name", "type", "description", "regex", "source", "mcc_id", "mcc_ids")
+# String fields holding a list in the JSON (MCC codes never contain a comma)
+LIST_FIELDS = frozenset(["mcc_ids"])
+RECORD_FIELDS = len(STRING_FIELDS) + 2
+
+
+def _u32s(values):
+    values = array("I", values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def to_binary(tags, related_closure=None, aliases=None):
+    """db_tags.bin bytes for `tags` (and the closure section and aliases, if given)."""
+    strings = {}
+
+    def intern(value):
+        if value is None:
+            return NULL
+        string_id = strings.get(value)
+        if string_id is None:
+            string_id = strings[value] = len(strings)
+        return string_id
+
+    def field_id(tag, field):
+        if field not in tag:
+            return ABSENT
+        if field in LIST_FIELDS:
+            return intern(",".join(tag[field]))
+        return intern(tag[field])
+
+    records = []
+    related = []
+    for tag in tags:
+        records.extend(field_id(tag, field) for field in STRING_FIELDS)
+        if "related" in tag:
+            records.extend((len(related), len(tag["related"])))
+            related.extend(intern(name) for name in tag["related"])
+        else:
+            records.extend((ABSENT, 0))
+    alias_pairs = []
+    for alias, name in sorted((aliases or {}).items()):
+        alias_pairs.extend((intern(alias), intern(name)))
+
+    encoded = [s.encode("utf-8") for s in strings]
+    string_offsets = [0]
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+    name_order = sorted(range(len(tags)), key=lambda i: tags[i]["name"].encode("utf-8"))
+
+    flags = 0
+    closure = []
+    targets = []
+    if related_closure is not None:
+        flags |= HAS_CLOSURE
+        closure = related_closure["offsets"]
+        targets = related_closure["targets"]
+
+    header = _HEADER.pack(BINARY_MAGIC, BINARY_VERSION, flags, len(tags), len(encoded),
+                          len(related), len(targets), string_offsets[-1], len(alias_pairs) // 2)
+    return b"".join([header, _u32s(string_offsets), _u32s(records), _u32s(related),
+                     _u32s(name_order), _u32s(closure), _u32s(targets), _u32s(alias_pairs), *encoded])
+
+
+class BinaryTagDB:
+    """Read-only view of db_tags.bin.
+
+    Sections are memoryview casts over the buffer (the mmap for open()), so
+    loading copies nothing; strings are decoded when a tag is read.
+    """
+
+    def __init__(self, buf):
+        self._mmap = None
+        view = memoryview(buf)
+        (magic, version, self.flags, n_tags, n_strings, n_related,
+         n_targets, blob_len, n_aliases) = _HEADER.unpack_from(view)
+        if magic != BINARY_MAGIC:
+            raise ValueError("Not a tag DB binary")
+        if version != BINARY_VERSION:
+            raise ValueError(f"Unsupported tag DB binary version {version}")
+
+        pos = _HEADER.size
+        sections = []
+        n_closure = n_tags + 1 if self.flags & HAS_CLOSURE else 0
+        for count in (n_strings + 1, n_tags * RECORD_FIELDS, n_related, n_tags, n_closure, n_targets,
+                      2 * n_aliases):
+            sections.append(self._u32_view(view[pos:pos + 4 * count]))
+            pos += 4 * count
+        (self._string_offsets, self._records, self._related, self._name_order,
+         self._closure_offsets, self._closure_targets, self._aliases) = sections
+        self._blob = view[pos:pos + blob_len]
+        if len(self._blob) != blob_len:
+            raise ValueError("Truncated tag DB binary")
+        self._views = [*sections, self._blob, view]
+
+    @staticmethod
+    def _u32_view(view):
+        if sys.byteorder == "little":
+            return view.cast("I")
+        values = array("I", view.tobytes())  # Big-endian hosts pay for a copy
+        values.byteswap()
+        return values
+
+    @classmethod
+    def open(cls, path=BINARY_DB_PATH):
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        db = cls(mapped)
+        db._mmap = mapped
+        return db
+
+    def close(self):
+        # Every view must be released before the mmap can close
+        for view in self._views:
+            if isinstance(view, memoryview):
+                view.release()
+        self._views = []
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._name_order)
+
+    def string(self, string_id):
+        if string_id == NULL:
+            return None
+        return str(self._blob[self._string_offsets[string_id]:self._string_offsets[string_id + 1]], "utf-8")
+
+    def name(self, index):
+        return self.string(self._records[index * RECORD_FIELDS])
+
+    def related(self, index):
+        base = index * RECORD_FIELDS + len(STRING_FIELDS)
+        offset, length = self._records[base], self._records[base + 1]
+        if offset == ABSENT:
+            return None
+        return [self.string(i) for i in self._related[offset:offset + length]]
+
+    def tag(self, index):
+        """The tag as the dict db_tags.json holds for it."""
+        base = index * RECORD_FIELDS
+        tag = {}
+        for field, string_id in zip(STRING_FIELDS, self._records[base:base + len(STRING_FIELDS)]):
+            if string_id != ABSENT:
+                value = self.string(string_id)
+                tag[field] = value.split(",") if field in LIST_FIELDS else value
+        related = self.related(index)
+        if related is not None:
+            tag["related"] = related
+        return tag
+
+    def __iter__(self):
+        return (self.tag(i) for i in range(len(self)))
+
+    def find(self, name):
+        """Indexes of the tags called `name` (a binary search over name_order)."""
+        key = name.encode("utf-8")
+        order = self._name_order
+
+        def name_bytes(i):
+            string_id = self._records[order[i] * RECORD_FIELDS]
+            return self._blob[self._string_offsets[string_id]:self._string_offsets[string_id + 1]].tobytes()
+
+        lo = bisect.bisect_left(range(len(order)), key, key=name_bytes)
+        found = []
+        while lo < len(order) and name_bytes(lo) == key:
+            found.append(order[lo])
+            lo += 1
+        return found
+
+    @property
+    def related_closure(self):
+        if not self.flags & HAS_CLOSURE:
+            return None
+        return {"version": 1, "offsets": self._closure_offsets.tolist(),
+                "targets": self._closure_targets.tolist()}
+
+    @property
+    def aliases(self):
+        """{alias: canonical name}, as in db_tags.json."""
+        ids = self._aliases
+        return {self.string(ids[i]): self.string(ids[i + 1]) for i in range(0, len(ids), 2)}
+
+
+def binary_mismatches(tags, related_closure, db, aliases=None):
+    """Human-readable differences between the JSON data and a BinaryTagDB."""
+    problems = []
+    if len(db) != len(tags):
+        problems.append(f"{len(db)} tags in the binary, {len(tags)} in the JSON")
+    for i, (expected, actual) in enumerate(zip(tags, db)):
+        if expected != actual:
+            problems.append(f"tag {i} ({expected.get('name')!r}) differs: {actual!r}")
+    if db.related_closure != related_closure:
+        problems.append("related_closure differs")
+    if db.aliases != (aliases or {}):
+        problems.append("aliases differ")
+    for name in {tag["name"] for tag in tags}:
+        if [tags[i]["name"] for i in db.find(name)] != [name] * sum(t["name"] == name for t in tags):
+            problems.append(f"find({name!r}) is wrong")
+            break
+    return problems
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Check db_tags.bin against db_tags.json")
+    parser.add_argument("db", nargs="?", default=DEFAULT_DB_PATH,
+                        help="Path to db_tags.json; the binary next to it is checked")
+    args = parser.parse_args(argv)
+
+    bin_path = os.path.splitext(args.db)[0] + ".bin"
+    try:
+        with open(args.db, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        with BinaryTagDB.open(bin_path) as db:
+            problems = binary_mismatches(data["tags"], data.get("related_closure"), db, data.get("aliases"))
+    except FileNotFoundError as e:
+        print(f"Error: File not found at {e.filename}")
+        return 1
+    except ValueError as e:
+        print(f"Error: {bin_path}: {e}")
+        return 1
+    for problem in problems[:20]:
+        print(problem)
+    print(f"{bin_path}: {'OK' if not problems else f'{len(problems)} mismatches'} "
+          f"({os.path.getsize(bin_path)} bytes, JSON {os.path.getsize(args.db)} bytes)")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Graph helpers for the `related` links between tags.
+
+`related` links chain (Records -> Music -> Entertainment) and can loop
+(Legal <-> Government). The closure is computed once over the strongly
+connected components, so every consumer can expand a tag with a lookup
+instead of walking links.
+"""
+
+
+def strongly_connected(graph):
+    """Tarjan's algorithm, iterative. `graph` maps node -> iterable of nodes.
+
+    Returns the components as lists, in reverse topological order: every
+    component comes after all components reachable from it.
+    """
+    nodes = list(graph)
+    seen_nodes = set(nodes)
+    for edges in list(graph.values()):
+        for node in edges:
+            if node not in seen_nodes:
+                seen_nodes.add(node)
+                nodes.append(node)
+
+    index = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    components = []
+    counter = 0
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(graph.get(root, ())))]
+        while work:
+            node, edges = work[-1]
+            advanced = False
+            for nxt in edges:
+                if nxt not in index:
+                    index[nxt] = low[nxt] = counter
+                    counter += 1
+                    stack.append(nxt)
+                    on_stack.add(nxt)
+                    work.append((nxt, iter(graph.get(nxt, ()))))
+                    advanced = True
+                    break
+                if nxt in on_stack:
+                    low[node] = min(low[node], index[nxt])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+    return components
+
+
+def related_closure(graph):
+    """Everything reachable from each node, excluding the node itself.
+
+    Returns (closure, cycles). closure maps node -> tuple that starts with the
+    node's direct links in declared order, followed by the rest of its
+    reachable set in first-seen node order. cycles lists each component of
+    more than one node (or with a self link), e.g. ["Legal", "Government"].
+    """
+    components = strongly_connected(graph)
+    component_of = {}
+    for i, component in enumerate(components):
+        for node in component:
+            component_of[node] = i
+
+    # Reverse topological order: successors are always resolved first
+    reach = []
+    cycles = []
+    for i, component in enumerate(components):
+        reachable = set(component)
+        for node in component:
+            for nxt in graph.get(node, ()):
+                j = component_of[nxt]
+                if j != i:
+                    reachable |= reach[j]
+        reach.append(reachable)
+        if len(component) > 1 or any(node in graph.get(node, ()) for node in component):
+            cycles.append(component[::-1])
+
+    first_seen = {}
+    for node in list(graph) + list(component_of):
+        first_seen.setdefault(node, len(first_seen))
+
+    closure = {}
+    for node in first_seen:
+        direct = [n for n in dict.fromkeys(graph.get(node, ())) if n != node]
+        rest = reach[component_of[node]] - set(direct) - {node}
+        closure[node] = tuple(direct) + tuple(sorted(rest, key=first_seen.__getitem__))
+    return closure, cycles
@@ -0,0 +1,97 @@
+"""Inventory statistics for the tag DB, computed in one pass over the tags.
+
+Everything is a dict/Counter lookup per tag or per `related` entry, so the
+cost grows with the size of the DB (plus the pairs within each tag's own
+`related` list for co-occurrence), never with tags x tags.
+"""
+from collections import Counter
+
+
+def source_of(tag):
+    # Older DBs carry no "source"; an mcc_id means the tag came from the MCC list
+    return tag.get("source") or ("MCC" if tag.get("mcc_id") else "Unspecified")
+
+
+class Inventory:
+    """Statistics for a list of tag dicts.
+
+    by_type / by_source: Counter of tags per type and per source.
+    referenced: Counter of how many tags list each name in `related`.
+    cooccurrence: sparse {(a, b): n} with a < b, counting the tags whose
+        `related` list holds both a and b.
+    orphans: names of tags that no tag references (orphans_by_type counts them).
+    dangling: {missing name: [tags that reference it]}.
+    duplicates: {name: [types]} for names defined more than once, ignoring case.
+    """
+
+    def __init__(self, tags):
+        self.by_type = Counter()
+        self.by_source = Counter()
+        self.referenced = Counter()
+        self.cooccurrence = Counter()
+        types_by_name = {}
+        folded_names = {}
+        referrers = {}
+
+        for tag in tags:
+            name = tag["name"]
+            self.by_type[tag.get("type")] += 1
+            self.by_source[source_of(tag)] += 1
+            types_by_name.setdefault(name, []).append(tag.get("type"))
+            folded_names.setdefault(name.casefold(), []).append((name, tag.get("type")))
+
+            related = sorted(set(tag.get("related", ())))
+            self.referenced.update(related)
+            for r in related:
+                referrers.setdefault(r, []).append(name)
+            for i, a in enumerate(related):
+                for b in related[i + 1:]:
+                    self.cooccurrence[a, b] += 1
+
+        self.orphans = [name for name in types_by_name if name not in self.referenced]
+        self.orphans_by_type = Counter(types_by_name[name][0] for name in self.orphans)
+        self.dangling = {name: referrers[name] for name in self.referenced if name not in types_by_name}
+        self.duplicates = {entries[0][0]: [t for _, t in entries]
+                           for entries in folded_names.values() if len(entries) > 1}
+        self.total = sum(self.by_type.values())
+
+    def to_dict(self, top=20):
+        return {
+            "total": self.total,
+            "by_type": dict(self.by_type.most_common()),
+            "by_source": dict(self.by_source.most_common()),
+            "most_referenced": [{"tag": n, "count": c} for n, c in self.referenced.most_common(top)],
+            "top_cooccurrence": [{"tags": [a, b], "count": c}
+                                 for (a, b), c in self.cooccurrence.most_common(top)],
+            "cooccurrence_pairs": len(self.cooccurrence),
+            "orphans": self.orphans,
+            "dangling": self.dangling,
+            "duplicates": self.duplicates,
+        }
+
+    def to_markdown(self, top=20):
+        lines = [f"# Tag inventory ({self.total} tags)", ""]
+
+        def table(title, header, rows):
+            rows = list(rows)
+            lines.extend([f"## {title}", ""])
+            if not rows:
+                lines.extend(["None.", ""])
+                return
+            lines.extend([f"| {' | '.join(header)} |", "| " + " | ".join("---" for _ in header) + " |"])
+            lines.extend("| " + " | ".join(str(c).replace("|", "\\|") for c in row) + " |" for row in rows)
+            lines.append("")
+
+        table("By type", ["Type", "Count"], self.by_type.most_common())
+        table("By source", ["Source", "Count"], self.by_source.most_common())
+        table("Most referenced", ["Tag", "Referenced by"], self.referenced.most_common(top))
+        table(f"Related co-occurrence (top {top} of {len(self.cooccurrence)} pairs)", ["Tag", "Tag", "Count"],
+              ((a, b, c) for (a, b), c in self.cooccurrence.most_common(top)))
+        table("Duplicate names", ["Tag", "Types"],
+              ((name, ", ".join(map(str, types))) for name, types in self.duplicates.items()))
+        table("Dangling related names", ["Name", "Referenced by"],
+              ((name, ", ".join(refs)) for name, refs in self.dangling.items()))
+
+        table(f"Orphans by type ({len(self.orphans)} tags nothing references)", ["Type", "Count"],
+              self.orphans_by_type.most_common())
+        return "\n".join(lines)
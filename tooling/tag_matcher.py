@@ -0,0 +1,259 @@
+"""Applies the db_tags vendor regexes and MCC ids to transactions.
+
+This is the local half of the "lazy AI matching" in docs/tagging.md: a
+description is tagged from the tag DB when a vendor pattern or its MCC code
+matches, and reported as a miss (needing the AI fallback) otherwise.
+
+All vendor patterns are compiled into one regex, the MCC ids into a
+dict, and the transitive `related` expansion of every tag is taken from the
+generator's `related_closure` section (or computed once up front), so tagging
+a transaction is one regex search plus dict lookups.
+
+    python -m tooling.tag_matcher sandbox_transactions.yaml
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+from .tag_db import DEFAULT_DB_PATH, load_tag_db, mcc_codes
+from .tag_graph import related_closure
+from .transactions import description_of, load_transactions
+
+# A regex body made only of plain characters and escaped punctuation is a literal
+_LITERAL_BODY = re.compile(r"(?:[^\\.^$*+?{}\[\]|()]|\\[^A-Za-z0-9])*")
+
+# from_file() matchers by DB path, kept with the TagDB they were built from
+_matchers = {}
+
+
+def literal_text(tag):
+    """The literal a vendor pattern stands for, or None if it is a real regex."""
+    pattern = tag["regex"]
+    body = pattern[4:] if pattern.startswith("(?i)") else pattern
+    # The generator writes "(?i){name}" unescaped, so "Disney+" means the name
+    if body == tag["name"]:
+        return body
+    if _LITERAL_BODY.fullmatch(body):
+        return re.sub(r"\\(.)", r"\1", body)
+    return None
+
+
+def trie_pattern(words):
+    """Regex source matching any of `words`, factored by common prefix.
+
+    At a given position the regex engine then follows one branch per
+    character instead of retrying every word, and since each optional tail is
+    greedy the longest word wins ("Whole Foods Market" over "Whole Foods").
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node):
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+class SubstringMatcher:
+    """Finds which of many literal keys occur in a text, ignoring case.
+
+    Built once from a key -> value mapping; each lookup is a single scan of
+    the casefolded text with one prefix-factored regex, however many keys
+    there are. Keys that casefold alike keep the first value.
+    """
+
+    def __init__(self, mapping):
+        self.values = {}
+        for key, value in mapping.items():
+            if key:
+                self.values.setdefault(key.casefold(), value)
+        self._search = None
+        self._scan = None
+        if self.values:
+            pattern = trie_pattern(self.values)
+            self._search = re.compile(pattern).search
+            # Zero-width lookahead reports a (longest) hit at every position, overlaps included
+            self._scan = re.compile(f"(?=({pattern}))").finditer
+
+    def __bool__(self):
+        return bool(self.values)
+
+    def first(self, text):
+        """Value of the leftmost key in `text` (longest one at that position)."""
+        if self._search is None:
+            return None
+        m = self._search(text.casefold())
+        return self.values[m.group(0)] if m else None
+
+    def longest(self, text):
+        """Value of the longest key anywhere in `text`; ties go to the leftmost."""
+        if self._search is None:
+            return None
+        folded = text.casefold()
+        first = self._search(folded)
+        if first is None:
+            return None
+        best = first.group(0)
+        for m in self._scan(folded, first.start() + 1):
+            if len(m.group(1)) > len(best):
+                best = m.group(1)
+        return self.values[best]
+
+
+class TagMatcher:
+    def __init__(self, tags, closure=None):
+        self.tags = tags
+        self.by_mcc = {}
+        for tag in tags:
+            for code in mcc_codes(tag):
+                self.by_mcc.setdefault(code, []).append(tag["name"])
+        self.expanded = self._expand(tags, closure)
+
+        # Nearly all vendor patterns are literals, so they go into one prefix-factored
+        # alternation matched against the casefolded description (much faster than
+        # re.IGNORECASE), and the matched text is looked up in a dict. Anything
+        # else is kept as a real regex in a second, grouped alternation.
+        literals = {}  # literal -> vendor tag name
+        regexes = []
+        for tag in tags:
+            if not tag.get("regex"):
+                continue
+            literal = literal_text(tag)
+            if literal is not None:
+                literals.setdefault(literal, tag["name"])
+            else:
+                body = tag["regex"][4:] if tag["regex"].startswith("(?i)") else tag["regex"]
+                regexes.append((body, tag["name"]))
+
+        self.literals = SubstringMatcher(literals)
+
+        # Each body is a named group, so groups inside the bodies (e.g. "(INTRST|INTEREST)"
+        # from the app's learned patterns) cannot shift which vendor a hit maps to
+        self.regex_names = [name for _, name in regexes]
+        self.regex_re = None
+        if regexes:
+            self.regex_re = re.compile("|".join(f"(?P<v{i}>{body})" for i, (body, _) in enumerate(regexes)),
+                                       re.IGNORECASE)
+
+    @staticmethod
+    def _expand(tags, closure):
+        """name -> (name, *every tag name reachable through `related`).
+
+        Uses the generator's precomputed `related_closure` section when it
+        matches `tags`, and computes the closure itself otherwise.
+        """
+        expanded = {}
+        if closure and len(closure.get("offsets", ())) == len(tags) + 1:
+            offsets, targets = closure["offsets"], closure["targets"]
+            for i, tag in enumerate(tags):
+                if tag["name"] not in expanded:
+                    names = (tags[j]["name"] for j in targets[offsets[i]:offsets[i + 1]])
+                    expanded[tag["name"]] = tuple(dict.fromkeys((tag["name"], *names)))
+            return expanded
+
+        graph = {}
+        for tag in tags:
+            # Names repeat across types (e.g. Fast Food Market/Service); merge their edges
+            edges = graph.setdefault(tag["name"], [])
+            edges.extend(r for r in tag.get("related", []) if r not in edges)
+        reachable, _ = related_closure(graph)
+        for name, names in reachable.items():
+            expanded[name] = (name,) + names
+        return expanded
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_DB_PATH):
+        """The matcher for the DB at `path`, rebuilt only after the file changes."""
+        db = load_tag_db(path)
+        key = os.path.abspath(path)
+        cached = _matchers.get(key)
+        if cached is not None and cached[0] is db and type(cached[1]) is cls:
+            return cached[1]
+        matcher = cls(db.tags, db.related_closure)
+        _matchers[key] = (db, matcher)
+        return matcher
+
+    def match_vendor(self, description):
+        """Returns the vendor tag name found in `description`, or None."""
+        vendor = self.literals.first(description)
+        if vendor is not None:
+            return vendor
+        if self.regex_re is not None:
+            m = self.regex_re.search(description)
+            if m:
+                return self.regex_names[int(m.lastgroup[1:])]
+        return None
+
+    def match(self, description, mcc=None):
+        """Returns (vendor name or None, expanded tag names); empty tags is a miss."""
+        vendor = self.match_vendor(description)
+        names = []
+        if vendor:
+            names.extend(self.expanded.get(vendor, (vendor,)))
+        if mcc is not None:
+            for name in self.by_mcc.get(str(mcc), ()):
+                names.extend(self.expanded.get(name, (name,)))
+        if len(names) > 1:
+            names = list(dict.fromkeys(names))
+        return vendor, tuple(names)
+
+    def match_batch(self, transactions):
+        """Tags a batch in one pass.
+
+        Returns (results, misses): results[i] is the match() result for
+        transactions[i]; misses lists the indexes that need the AI fallback.
+        Repeated (description, mcc) pairs are only matched once.
+        """
+        memo = {}
+        results = []
+        misses = []
+        for i, tx in enumerate(transactions):
+            key = (description_of(tx), tx.get("mcc"))
+            result = memo.get(key)
+            if result is None:
+                result = memo[key] = self.match(*key)
+            results.append(result)
+            if not result[1]:
+                misses.append(i)
+        return results, misses
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Tag transactions from db_tags.json")
+    parser.add_argument("transactions", help="Transactions file (.json or .yaml)")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="Path to db_tags.json")
+    args = parser.parse_args(argv)
+
+    try:
+        matcher = TagMatcher.from_file(args.db)
+    except FileNotFoundError:
+        print(f"Error: File not found at {args.db}")
+        return 1
+    transactions = load_transactions(args.transactions)
+
+    start = time.perf_counter()
+    results, misses = matcher.match_batch(transactions)
+    elapsed = time.perf_counter() - start
+
+    for tx, (vendor, names) in zip(transactions, results):
+        if names:
+            print(f"{description_of(tx)!r} -> {vendor or '(mcc)'}: {', '.join(names)}")
+    print(f"Matched {len(transactions) - len(misses)} of {len(transactions)} transactions "
+          f"in {elapsed * 1000:.2f} ms; {len(misses)} need the AI fallback:")
+    for i in misses:
+        print(f" - {description_of(transactions[i])!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
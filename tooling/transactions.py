@@ -0,0 +1,225 @@
+"""Readers for the transaction fixtures used by the tooling.
+
+Handles mock_transactions.json (a JSON array) and sandbox_transactions.yaml.
+The YAML reader only understands that file's shape - a top-level list of flat
+mappings whose values are JSON-compatible scalars or flow lists - which keeps
+the tooling free of a pyyaml dependency.
+
+The streaming helpers read and rewrite transaction exports of any size - a
+top-level JSON array or JSON Lines - one record at a time, so memory stays
+bounded by the largest single record rather than the file.
+"""
+import json
+import os
+import tempfile
+
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+READ_CHUNK = 1 << 16
+# The largest single item iter_json_array reads ahead for before giving up
+MAX_ITEM_SIZE = 1 << 24
+# Longest token tail raw_decode can stop in when an item is cut off ("-Infinit")
+_PARTIAL_TOKEN = 16
+
+
+def parse_scalar(raw):
+    raw = raw.strip()
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except ValueError:
+        return raw.strip("'")
+
+
+def iter_yaml_records(path):
+    """Yields each `- key: value` mapping of a flat YAML list."""
+    record = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            stripped = line.strip()
+            if not stripped or stripped.startswith("#") or ":" not in stripped:
+                continue
+            if stripped.startswith("- "):
+                if record is not None:
+                    yield record
+                record = {}
+                stripped = stripped[2:]
+            elif record is None:
+                continue  # Top-level key such as "transactions:"
+            key, _, value = stripped.partition(":")
+            record[key.strip()] = parse_scalar(value)
+    if record is not None:
+        yield record
+
+
+def load_transactions(path):
+    """Loads a transaction list from .json or .yaml/.yml."""
+    if path.endswith((".yaml", ".yml")):
+        return list(iter_yaml_records(path))
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("transactions", []) if isinstance(data, dict) else data
+
+
+def description_of(tx):
+    # Sandbox exports carry the raw bank string; mock data only has a name
+    return tx.get("description") or tx.get("name") or ""
+
+
+# Streaming
+
+def detect_format(path):
+    """"jsonl" or "array", from the suffix or else the first non-blank byte."""
+    if path.endswith(JSONL_SUFFIXES):
+        return "jsonl"
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.read(READ_CHUNK)
+            if not chunk:
+                return "array"  # Empty file: treat as an empty array
+            stripped = chunk.lstrip()
+            if stripped:
+                return "array" if stripped[0] == "[" else "jsonl"
+
+
+def iter_json_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{path}:{lineno}: {e}") from None
+
+
+def iter_json_array(path, chunk_size=READ_CHUNK, max_item_size=MAX_ITEM_SIZE):
+    """Yields the items of a top-level JSON array, reading `chunk_size` at a time.
+
+    Each item is decoded with raw_decode as soon as the buffer holds all of
+    it; only the unread tail of the buffer is kept between items. More is
+    read only when decoding stopped at the end of the buffer (the item is
+    incomplete, not malformed), and never for an item over `max_item_size`
+    characters, so a bad record fails without reading the rest of the file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            nonlocal buf, pos, eof
+            chunk = f.read(chunk_size)
+            if chunk:
+                buf = buf[pos:] + chunk
+                pos = 0
+            else:
+                eof = True
+
+        def skip_ws():
+            nonlocal pos
+            while True:
+                while pos < len(buf) and buf[pos].isspace():
+                    pos += 1
+                if pos < len(buf) or eof:
+                    return
+                fill()
+
+        skip_ws()
+        if pos >= len(buf):
+            return
+        if buf[pos] != "[":
+            raise ValueError(f"{path}: expected a JSON array")
+        pos += 1
+        skip_ws()
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                # A cut-off item fails in its last few characters (a partial number,
+                # literal or escape) or, for a string, where the string started;
+                # an error anywhere else is a malformed item
+                incomplete = len(buf) - e.pos <= _PARTIAL_TOKEN or e.msg.startswith("Unterminated string")
+                if eof or not incomplete:
+                    raise ValueError(f"{path}: invalid JSON array item: {e}") from None
+                if len(buf) - pos > max_item_size:
+                    raise ValueError(f"{path}: array item at offset {e.pos - pos} "
+                                     f"is over {max_item_size} characters") from None
+                fill()
+                continue
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(buf) and not eof:
+                fill()
+                continue
+            yield item
+            pos = end
+            skip_ws()
+            if pos >= len(buf):
+                raise ValueError(f"{path}: truncated JSON array")
+            if buf[pos] == "]":
+                return
+            if buf[pos] != ",":
+                raise ValueError(f"{path}: expected ',' or ']' at offset {pos}")
+            pos += 1
+            skip_ws()
+
+
+def iter_records(path, fmt=None):
+    fmt = fmt or detect_format(path)
+    return iter_json_lines(path) if fmt == "jsonl" else iter_json_array(path)
+
+
+def iter_transactions(path):
+    """Streams transactions from .yaml, JSON Lines or a JSON array.
+
+    Only a {"transactions": [...]} JSON document is loaded whole.
+    """
+    if path.endswith((".yaml", ".yml")):
+        return iter_yaml_records(path)
+    if path.endswith(JSONL_SUFFIXES) or detect_format(path) == "array":
+        return iter_records(path)
+    return iter(load_transactions(path))
+
+
+def write_json_array(records, f, indent=4):
+    """Writes `records` as a JSON array, byte-identical to json.dump(list, f, indent=indent)."""
+    pad = " " * indent
+    first = True
+    for record in records:
+        f.write("[\n" if first else ",\n")
+        first = False
+        f.write(pad + json.dumps(record, indent=indent).replace("\n", "\n" + pad))
+    f.write("[]" if first else "\n]")
+
+
+def write_json_lines(records, f):
+    for record in records:
+        f.write(json.dumps(record))
+        f.write("\n")
+
+
+def rewrite_records(path, records, fmt, indent=4):
+    """Writes `records` to a temp file beside `path`, then renames it over `path`.
+
+    `records` may be a generator reading `path` itself: the original stays in
+    place until the new file is complete, so an interrupted run leaves it intact.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            if fmt == "jsonl":
+                write_json_lines(records, out)
+            else:
+                write_json_array(records, out, indent)
+            out.flush()
+            os.fsync(out.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
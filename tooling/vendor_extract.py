@@ -0,0 +1,211 @@
+"""Vendor names from raw bank descriptions.
+
+docs/tagging.md: "COMPTONS MARKET SACRAMENTO CA" -> "Comptons Market". A
+description goes through precompiled rules, in order:
+
+1. bank phrases that name the transaction rather than a merchant (card
+   payments, deposits, interest, ACH payroll) map to a fixed vendor; all
+   phrases are one alternation, so the leftmost one wins. Deposits only
+   count at the start of the description ("MOBILE DEPOSIT", "DEPOSIT ID"),
+   not inside a merchant name ("TEXAS DEPOSIT GRILL");
+2. ACH/POS/card-network prefixes are stripped ("ACH Electronic Credit",
+   "POS DEBIT", "SQ *", "CHECKCARD 0115");
+3. everything from the first token holding a digit on is dropped (card and
+   store numbers, dates, reference ids), as is a trailing "CITY ST";
+4. a vendor name known to the tag DB wins if one occurs in what is left;
+5. otherwise the rest is the vendor, title-cased if it was all capitals.
+
+Results are memoised in an LRU cache keyed by the raw description, so a
+feed that repeats a merchant pays for the rules once per distinct string.
+
+The rules were written against sandbox_transactions.yaml; accuracy is
+measured on tests/data/vendor_holdout.yaml, which they were not tuned on.
+
+    python -m tooling.vendor_extract --accuracy tests/data/vendor_holdout.yaml
+    python -m tooling.vendor_extract --bench 2000000
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from functools import lru_cache
+
+from .tag_db import DEFAULT_DB_PATH, load_tag_db
+from .tag_matcher import SubstringMatcher
+from .transactions import description_of, load_transactions
+
+US_STATES = frozenset(
+    "AL AK AZ AR CA CO CT DE DC FL GA HI ID IL IN IA KS KY LA ME MD MA MI MN MS MO MT NE NV NH NJ "
+    "NM NY NC ND OH OK OR PA RI SC SD TN TX UT VT VA WA WV WI WY".split())
+# First words of two-word city names, dropped together with the city before a state code
+CITY_PREFIXES = frozenset(
+    "SAN SANTA SANT LOS LAS NEW SAINT ST FT FORT EL PALO SALT LONG PORT MOUNT MT NORTH SOUTH EAST WEST".split())
+# Words banks put before DEPOSIT (or DEP) on their own deposit lines ("ATM CASH DEPOSIT")
+DEPOSIT_PREFIXES = ["CD", "ATM", "CASH", "CHECK", "CHK", "MOBILE", "REMOTE", "ONLINE", "BRANCH", "TELLER",
+                    "COUNTER", "ACH", "SHARE"]
+
+# (phrase, vendor), matched against the upper-cased description. The vendor is a
+# format string over the phrase's named groups, which are capitalised first.
+# Every phrase starts with a literal letter or is anchored to the start, so the
+# combined regex below only tries a match where one of those letters is.
+PHRASE_RULES = [
+    (r"CREDIT\s*CARD\b.*\bPA?YME?NT\b|AUTOMATIC\s+PAYMENT\b|PAYMENT\W+THANK\s*YOU\b", "Credit Card Payment"),
+    (r"ACH\s+(?:ELECTRONIC\s+)?CREDIT\s*(?P<payer>[A-Z][A-Z&'.-]*)\s+(?:PAY|PAYROLL|PAYRLL)\b", "{payer} Payroll"),
+    # Only the bank's own deposit lines: merchants can have DEPOSIT in their name
+    (rf"^(?:(?:{'|'.join(DEPOSIT_PREFIXES)})\W+){{1,2}}DEP(?:OSIT)?\b|^DEPOSIT\b", "Bank Deposit"),
+    (r"INTE?RE?ST\s+(?:PA?YME?NT|EARNED|PAID)\b|INTRST\b", "Interest"),
+]
+# All phrases in one alternation (one scan per description); the leftmost match wins
+_PHRASES = re.compile("|".join(f"(?P<rule{i}>{phrase})" for i, (phrase, _) in enumerate(PHRASE_RULES)))
+
+_PREFIX = re.compile(r"""
+    ^(?: ACH \s+ (?:ELECTRONIC \s+)? (?:CREDIT|DEBIT) (?=[A-Z\s])
+       | POS \s+ (?:PURCHASE|DEBIT|WITHDRAWAL|REFUND)?
+       | (?:DEBIT|CHECK) \s* CARD \s+ (?:PURCHASE|\d{4})
+       | CHECKCARD \s+ \d{4}
+       | PURCHASE \s+ AUTHORI[ZS]ED \s+ ON \s+ \d\d/\d\d
+       | RECURRING \s+ PAYMENT
+       | (?:SQ|TST|PP|PAYPAL|SP|GOOGLE|APL) \s* \*
+    )\W*""", re.IGNORECASE | re.VERBOSE)
+_SEPARATORS = re.compile(r"[\s*#/|]+")
+_HAS_DIGIT = re.compile(r"\d")
+_VOWELS = re.compile(r"[AEIOUY]")
+
+
+def merchant_tokens(text):
+    """Upper-case merchant tokens of `text`: ids, numbers and a trailing "CITY ST" removed."""
+    tokens = [t.strip(".,-") for t in _SEPARATORS.split(text.upper())]
+    tokens = [t for t in tokens if t]
+    if _HAS_DIGIT.search(text):
+        for i, token in enumerate(tokens):
+            if _HAS_DIGIT.search(token):
+                # A leading number (e.g. a card number) is dropped on its own
+                tokens = tokens[:i] if i else [t for t in tokens if not _HAS_DIGIT.search(t)]
+                break
+    if len(tokens) >= 3 and tokens[-1] in US_STATES:
+        city = 2 if len(tokens) >= 4 and tokens[-3] in CITY_PREFIXES else 1
+        tokens = tokens[:-1 - city]
+    return tokens
+
+
+def display_case(words, original):
+    """`words` as they appeared in `original` if it had lower case, else title-cased.
+
+    Short all-consonant words (KFC, TJ) stay upper case.
+    """
+    if original != original.upper():
+        found = re.search(r"\W+".join(map(re.escape, words)), original, re.IGNORECASE)
+        if found:
+            return found.group(0)
+    return " ".join(w if len(w) <= 3 and not _VOWELS.search(w) else w.capitalize() for w in words)
+
+
+class VendorExtractor:
+    """extract(description) -> vendor name or None; see the module docstring.
+
+    `known_vendors` are names preferred when they occur in a description
+    (see from_tag_db). `cache_size` bounds the LRU cache of raw descriptions.
+    """
+
+    def __init__(self, known_vendors=(), cache_size=1 << 16):
+        self.known = SubstringMatcher({name: name for name in known_vendors})
+        self.extract = lru_cache(maxsize=cache_size)(self._extract)
+
+    @classmethod
+    def from_tag_db(cls, path=DEFAULT_DB_PATH, **kwargs):
+        db = load_tag_db(path)
+        return cls([tag["name"] for tag in db.by_type.get("Vendor", ())], **kwargs)
+
+    def _extract(self, description):
+        text = description.strip()
+        m = _PHRASES.search(text.upper())
+        if m:
+            vendor = PHRASE_RULES[int(m.lastgroup[4:])][1]
+            return vendor.format(**{k: v.capitalize() for k, v in m.groupdict().items() if v})
+        text = _PREFIX.sub("", text)
+        words = merchant_tokens(text)
+        if not words:
+            return None
+        if self.known:
+            vendor = self.known.first(" ".join(words))
+            if vendor is not None:
+                return vendor
+        return display_case(words, text)
+
+    def extract_batch(self, descriptions):
+        """[extract(d) for d in descriptions], through the same cache."""
+        return list(map(self.extract, descriptions))
+
+    def cache_info(self):
+        return self.extract.cache_info()
+
+
+def accuracy(extractor, transactions):
+    """(hits, misses): misses are (description, expected, extracted), compared ignoring case."""
+    labelled = [tx for tx in transactions if tx.get("vendor")]
+    extracted = extractor.extract_batch([description_of(tx) for tx in labelled])
+    misses = [(description_of(tx), tx["vendor"], got) for tx, got in zip(labelled, extracted)
+              if (got or "").casefold() != tx["vendor"].casefold()]
+    return len(labelled) - len(misses), misses
+
+
+def synthetic_descriptions(rows, seed=0):
+    """`rows` raw descriptions in bank-feed shapes, with varying store and reference numbers."""
+    rng = random.Random(seed)
+    merchants = ["COMPTONS MARKET", "Uber", "WHOLEFDS MKT", "Starbucks", "SHELL OIL", "TARGET",
+                 "Touchstone Climbing", "CHEVRON", "TRADER JOE'S", "Netflix.com", "SAFEWAY"]
+    places = ["SACRAMENTO CA", "SAN FRANCISCO CA", "OAKLAND CA", "SF**POOL**", "AUSTIN TX", ""]
+    shapes = ["{m} {place}", "{m} #{store} {place}", "POS DEBIT {m} {store} {place}",
+              "ACH Electronic Debit{m} {ref}", "SQ *{m} {place}", "CHECKCARD {mmdd} {m} {ref} {place}"]
+    out = []
+    for _ in range(rows):
+        out.append(rng.choice(shapes).format(
+            m=rng.choice(merchants), place=rng.choice(places), store=rng.randint(1, 400),
+            ref=rng.randint(10 ** 5, 10 ** 6), mmdd=f"{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}").strip())
+    return out
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(prog=prog, description="Extract vendor names from raw bank descriptions")
+    parser.add_argument("descriptions", nargs="*", help="Descriptions to extract a vendor from")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="db_tags.json for known vendor names")
+    parser.add_argument("--no-db", action="store_true", help="Use the rules only")
+    parser.add_argument("--accuracy", metavar="TRANSACTIONS",
+                        help="Compare against the `vendor` labels of a transactions file")
+    parser.add_argument("--bench", type=int, metavar="ROWS", help="Time extraction of ROWS synthetic descriptions")
+    parser.add_argument("--cache-size", type=int, default=1 << 16, help="LRU cache entries (default: 65536)")
+    args = parser.parse_args(argv)
+
+    if args.no_db:
+        extractor = VendorExtractor(cache_size=args.cache_size)
+    else:
+        try:
+            extractor = VendorExtractor.from_tag_db(args.db, cache_size=args.cache_size)
+        except FileNotFoundError:
+            print(f"Error: File not found at {args.db} (use --no-db for the rules only)")
+            return 1
+
+    for description, vendor in zip(args.descriptions, extractor.extract_batch(args.descriptions)):
+        print(f"{description!r} -> {vendor!r}")
+
+    if args.accuracy:
+        hits, misses = accuracy(extractor, load_transactions(args.accuracy))
+        total = hits + len(misses)
+        print(f"Accuracy: {hits} of {total} vendor labels ({hits / total:.0%})" if total else "No vendor labels")
+        for description, expected, got in misses:
+            print(f" - {description!r}: expected {expected!r}, got {got!r}")
+
+    if args.bench:
+        rows = synthetic_descriptions(args.bench)
+        start = time.perf_counter()
+        extractor.extract_batch(rows)
+        elapsed = time.perf_counter() - start
+        info = extractor.cache_info()
+        print(f"Extracted {len(rows)} descriptions in {elapsed:.2f} s ({len(rows) / elapsed:,.0f} rows/s); "
+              f"{len(set(rows))} distinct, cache {info.hits} hits / {info.misses} misses")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""Watch mode: rebuilds the tag artifacts when their sources change.
+
+Polls the mtimes (and sizes) of everything the tag pipeline reads, so no
+file-watching dependency is needed, and waits for a burst of saves to go
+quiet before acting. Only the stages downstream of what changed run:
+
+    generate_tags_db.py, the AI cache,      -> regenerate db_tags.*, then the two below
+    legacy caches, learned vendors, MCC CSV
+    migrate_mock_tags.py, the transactions  -> check the migration (nothing is rewritten)
+    db_tags.json                            -> check the migration, refresh the inventory
+
+Everything runs in this process. The edited definition modules are
+reloaded, the generator runs --offline --incremental, and the tag DB and
+the transactions stay parsed between iterations (each is re-read only
+after its file changes), so an iteration takes milliseconds.
+Files the stages write themselves do not trigger another iteration.
+
+    budgetizer-tools watch --report docs/inventory.md
+    budgetizer-tools watch --once --batch-size 20    # unknown options go to the generator
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import sys
+import time
+from collections import Counter, deque
+
+from . import generate_tags_db, migrate_mock_tags
+from .analyze import inventory_text
+from .tag_db import load_tag_db
+from .tag_inventory import Inventory
+from .transactions import detect_format, iter_records
+
+REPORT_FORMATS = {".md": "md", ".json": "json", ".csv": "csv"}
+# Generator output lines worth showing when --verbose is off
+GENERATOR_NOTICES = ("Error", "Warning", "AI Generated", "AI Related", "Consolidated", "Incremental build")
+
+
+def stamp(path):
+    """(mtime_ns, size) of `path`, or None while it does not exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def module_file(module):
+    return os.path.abspath(module.__file__)
+
+
+class TagWatcher:
+    """One watch session; run_once() runs the stages for a set of changed paths.
+
+    `generator_argv` is passed to the generator's parse_args after
+    --offline --incremental and the base and output directories.
+    """
+
+    def __init__(self, base_dir=".", output_dir=None, transactions=None, report=None,
+                 generator_argv=(), verbose=False):
+        self.generator = generate_tags_db
+        self.migrator = migrate_mock_tags
+        self.paths = self.generator.BuildPaths(base_dir, output_dir)
+        self.generator_argv = ["--offline", "--incremental", "--base-dir", self.paths.base_dir,
+                               "--output-dir", self.paths.output_dir, *generator_argv]
+        self.transactions_path = os.path.abspath(
+            transactions or os.path.join(self.paths.output_dir, "mock_transactions.json"))
+        self.report = report
+        self.verbose = verbose
+        self._transactions = (None, [])  # (stamp, parsed records)
+        self.stamps = {}
+
+    @property
+    def sources(self):
+        """{path: stage} for every watched file; "regenerate" implies the others."""
+        paths = self.paths
+        watched = dict.fromkeys([module_file(self.generator), paths.cache_store, paths.legacy_names,
+                                 paths.legacy_relations, paths.learned_vendors, paths.mcc_snapshot],
+                                "regenerate")
+        watched.update(dict.fromkeys([module_file(self.migrator), self.transactions_path], "migration"))
+        watched[paths.json] = "db"
+        return watched
+
+    def refresh(self):
+        self.stamps = {path: stamp(path) for path in self.sources}
+
+    def poll(self):
+        """Paths whose stamp changed since the last poll or refresh."""
+        changed = set()
+        for path in self.sources:
+            current = stamp(path)
+            if current != self.stamps.get(path):
+                self.stamps[path] = current
+                changed.add(path)
+        return changed
+
+    def wait_for_changes(self, interval=0.5, debounce=0.3):
+        """Blocks until something changed and then `debounce` seconds passed without another change."""
+        changed = set()
+        while not changed:
+            time.sleep(interval)
+            changed = self.poll()
+        quiet_since = time.monotonic()
+        while time.monotonic() - quiet_since < debounce:
+            time.sleep(min(interval, debounce) / 2)
+            more = self.poll()
+            if more:
+                changed |= more
+                quiet_since = time.monotonic()
+        return changed
+
+    def regenerate(self):
+        """Reloads the generator's definitions and runs it; returns the run summary or None."""
+        out = io.StringIO()
+        try:
+            self.generator = importlib.reload(self.generator)
+            with contextlib.redirect_stdout(out):
+                summary = self.generator.generate(self.generator.parse_args(self.generator_argv), self.paths)
+        except Exception as e:  # A half-edited definitions file must not end the session
+            print(f"Regenerate failed: {type(e).__name__}: {e}")
+            return None
+        finally:
+            for line in out.getvalue().splitlines():
+                if self.verbose or line.startswith(GENERATOR_NOTICES):
+                    print(f"  {line}")
+        counters = summary["counters"]
+        written = summary["bytes_written"]["files"]
+        print(f"Regenerated {counters.get('tags', 0)} tags; "
+              + (f"wrote {', '.join(os.path.basename(p) for p in written)}" if written else "nothing changed on disk")
+              + (f"; {summary['ai']['calls']} AI calls" if summary["ai"].get("calls") else ""))
+        return summary
+
+    def transactions(self):
+        """The parsed transactions, re-read only after the file changed."""
+        current = stamp(self.transactions_path)
+        if current != self._transactions[0]:
+            records = list(iter_records(self.transactions_path, detect_format(self.transactions_path)))
+            self._transactions = (current, records)
+        return self._transactions[1]
+
+    def check_migration(self):
+        """Runs the migration over copies of the transactions; returns its totals or None."""
+        try:
+            self.migrator = importlib.reload(self.migrator)
+            allowed = self.migrator.load_allowed_tags(self.paths.json)
+            records = [dict(tx) for tx in self.transactions()]  # migrate_transaction replaces tx["category"]
+        except Exception as e:
+            print(f"Migration check failed: {type(e).__name__}: {e}")
+            return None
+        totals = {"updated": 0, "warnings": Counter()}
+        deque(self.migrator.migrate_records(records, allowed, totals), maxlen=0)
+        kinds = Counter()
+        for (kind, _, _), count in totals["warnings"].items():
+            kinds[kind] += count
+        print(f"Migration check: {totals['updated']} of {len(records)} transactions would update; "
+              f"{kinds['missing']} missing tags, {kinds['unmapped']} unmapped")
+        if self.verbose and totals["warnings"]:
+            self.migrator.print_warning_summary(totals["warnings"])
+        return totals
+
+    def refresh_inventory(self):
+        try:
+            db = load_tag_db(self.paths.json)
+        except (OSError, ValueError) as e:
+            print(f"Inventory failed: {e}")
+            return None
+        inventory = Inventory(db.tags)
+        print(f"Inventory: {inventory.total} tags, {len(inventory.duplicates)} duplicate names, "
+              f"{len(inventory.dangling)} dangling related names, {len(inventory.orphans)} orphans")
+        if self.report:
+            fmt = REPORT_FORMATS.get(os.path.splitext(self.report)[1], "md")
+            os.makedirs(os.path.dirname(os.path.abspath(self.report)), exist_ok=True)
+            if self.generator.write_if_changed(self.report, inventory_text(db, fmt)):
+                print(f"Updated {self.report}")
+        return inventory
+
+    def run_once(self, changed=None):
+        """Runs the stages `changed` paths feed (all of them for None); returns their names."""
+        sources = self.sources
+        stages = {sources[path] for path in changed} if changed is not None else {"regenerate", "db"}
+        db_before = stamp(self.paths.json)
+        ran = []
+        if "regenerate" in stages:
+            self.regenerate()
+            ran.append("regenerate")
+        db_changed = "db" in stages or stamp(self.paths.json) != db_before
+        if db_changed or "migration" in stages:
+            self.check_migration()
+            ran.append("migration")
+        if db_changed:
+            self.refresh_inventory()
+            ran.append("inventory")
+        # What the stages wrote themselves is not a change to react to
+        self.refresh()
+        return ran
+
+    def watch(self, interval=0.5, debounce=0.3):
+        print(f"Watching {len(self.sources)} files (Ctrl-C to stop)...")
+        while True:
+            changed = self.wait_for_changes(interval, debounce)
+            names = sorted({os.path.basename(path) for path in changed})
+            print(f"[{time.strftime('%H:%M:%S')}] Changed: {', '.join(names)}")
+            start = time.perf_counter()
+            ran = self.run_once(changed)
+            print(f"Ran {', '.join(ran) or 'nothing'} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def main(argv=None, prog=None):
+    parser = argparse.ArgumentParser(
+        prog=prog, description="Regenerate the tag DB and re-check the migration when their sources change",
+        epilog="Other options are passed to the generator (e.g. --batch-size 20 --local-relations).")
+    parser.add_argument("--base-dir", default=".",
+                        help="Directory holding tooling/ (caches, MCC snapshot) and .env (default: current directory)")
+    parser.add_argument("--output-dir",
+                        help="Where db_tags.yaml/.json/.bin live (default: BASE_DIR/apps/desktop/assets/data)")
+    parser.add_argument("--transactions", help="Transactions to check the migration against "
+                                               "(default: OUTPUT_DIR/mock_transactions.json)")
+    parser.add_argument("--report", metavar="PATH", help="Keep the inventory report at PATH (.md, .json or .csv)")
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between polls (default: 0.5)")
+    parser.add_argument("--debounce", type=float, default=0.3,
+                        help="Seconds without further changes before a burst is acted on (default: 0.3)")
+    parser.add_argument("--once", action="store_true", help="Run every stage once and exit")
+    parser.add_argument("--verbose", action="store_true", help="Show the full generator and migration output")
+    args, generator_argv = parser.parse_known_args(argv)
+
+    watcher = TagWatcher(args.base_dir, args.output_dir, args.transactions, args.report,
+                         generator_argv, args.verbose)
+    # Bad generator options fail now, not on the first iteration
+    generate_tags_db.parse_args(watcher.generator_argv, prog=f"{prog or parser.prog} (generator options)")
+    start = time.perf_counter()
+    watcher.run_once()
+    print(f"Initial run took {(time.perf_counter() - start) * 1000:.0f} ms")
+    if args.once:
+        return 0
+    try:
+        watcher.watch(args.interval, args.debounce)
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
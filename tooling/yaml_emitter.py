@@ -0,0 +1,142 @@
+"""YAML writer for the tag DB (db_tags.yaml), without a pyyaml dependency.
+
+Each scalar is classified by one precompiled regex: strings a YAML 1.1
+reader would not read back as the same string - empty, padded with spaces,
+starting with an indicator (- ? : , [ ] { } # & * ! | > ' " % @ `),
+containing a key/comment separator, or looking like a bool, null, number
+or date (yes, off, ~, 0780, 1e3, 2024-01-31), or the special keys = and
+<< - are double-quoted, the rest are written plain. Quoted strings use
+JSON escaping, which is valid YAML, with the characters YAML does not
+allow raw (DEL, C1 controls, line and paragraph separators) escaped too.
+
+The document is built in memory and returned as one string, so callers
+write it in a single operation, and the same tags always give the same bytes.
+
+    python -m tooling.yaml_emitter [DB_JSON]    # checks db_tags.yaml against db_tags.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+
+_NEEDS_QUOTES = re.compile(r"""
+      \A\Z                                  # empty
+    | \A\s | \s\Z                           # leading / trailing whitespace
+    | \A[-?:,\[\]{}\#&*!|>'"%@`]            # leading indicator
+    | [:\#\[\]{}"]                          # separators and flow characters
+    | [\x00-\x1f\x7f-\x9f\u2028\u2029\ufeff\ufffe\uffff]   # control characters and line breaks
+    | \A(?:                                 # YAML 1.1 implicit types, matched whole
+          y|Y|yes|Yes|YES|n|N|no|No|NO|true|True|TRUE|false|False|FALSE
+        | on|On|ON|off|Off|OFF|null|Null|NULL|~
+        | =|<<                                                                  # value, merge keys
+        | [-+]?(?:0b[01_]+|0x[0-9a-fA-F_]+|0o?[0-7_]+|[0-9][0-9_]*)             # ints, 0780
+        | [-+]?(?:[0-9][0-9_]*)?\.[0-9_]*(?:[eE][-+]?[0-9]+)?                   # floats
+        | [-+]?[0-9][0-9_]*(?:\.[0-9_]*)?[eE][-+]?[0-9]+
+        | [-+]?\.(?:inf|Inf|INF) | \.(?:nan|NaN|NAN)
+        | [0-9]{4}-[0-9]{1,2}-[0-9]{1,2}(?:[Tt\ ].*)?                           # dates
+      )\Z
+""", re.VERBOSE)
+_UNPRINTABLE = re.compile(r"[\x7f-\x9f\u2028\u2029\ufeff\ufffe\uffff]")
+
+
+def scalar(value):
+    """`value` as a YAML scalar that reads back as the same string."""
+    value = str(value)
+    if _NEEDS_QUOTES.search(value):
+        # json.dumps escapes C0 controls only; DEL, C1 controls (NEL is a YAML
+        # line break) and the Unicode separators must not appear raw either
+        return _UNPRINTABLE.sub(lambda m: f"\\u{ord(m.group()):04x}", json.dumps(value, ensure_ascii=False))
+    return value
+
+
+def tag_fields(tag):
+    """The (key, value) pairs db_tags.yaml holds for `tag`, in file order."""
+    fields = [("name", tag["name"]), ("type", tag["type"])]
+
+    # Handle description carefully
+    desc = tag.get("description", "").replace("\n", " ").strip()
+    if desc:
+        fields.append(("description", desc))
+    for key in ("regex", "source"):
+        if key in tag:
+            fields.append((key, tag[key]))
+    if tag.get("mcc_id"):
+        fields.append(("mcc_id", tag["mcc_id"]))
+    if tag.get("mcc_ids"):
+        fields.append(("mcc_ids", list(tag["mcc_ids"])))
+    if tag.get("related"):
+        fields.append(("related", list(tag["related"])))
+    return fields
+
+
+def emit_tags(tags):
+    """db_tags.yaml text for `tags`."""
+    lines = ["tags:"]
+    for tag in tags:
+        prefix = "  - "
+        for key, value in tag_fields(tag):
+            if isinstance(value, list):
+                lines.append(f"{prefix}{key}:")
+                lines.extend(f"      - {scalar(item)}" for item in value)
+            else:
+                lines.append(f"{prefix}{key}: {scalar(value)}")
+            prefix = "    "
+    lines.append("")
+    return "\n".join(lines)
+
+
+def yaml_mismatches(text, tags):
+    """Differences between `text` re-parsed and the tags it was emitted from.
+
+    Needs pyyaml (an independent YAML 1.1 reader); returns None without it.
+    """
+    try:
+        import yaml
+    except ImportError:
+        return None
+    try:
+        parsed = (yaml.safe_load(text) or {}).get("tags") or []
+    except yaml.YAMLError as e:
+        return [f"does not parse: {e}"]
+    problems = []
+    if len(parsed) != len(tags):
+        problems.append(f"{len(parsed)} tags in the YAML, {len(tags)} expected")
+    for i, (tag, entry) in enumerate(zip(tags, parsed)):
+        expected = {key: value for key, value in tag_fields(tag)}
+        if entry != expected:
+            problems.append(f"tag {i} ({tag['name']!r}) reads back as {entry!r}")
+    return problems
+
+
+def main(argv=None, prog=None):
+    from .tag_db import DEFAULT_DB_PATH
+
+    parser = argparse.ArgumentParser(prog=prog, description="Check db_tags.yaml against db_tags.json")
+    parser.add_argument("db", nargs="?", default=DEFAULT_DB_PATH,
+                        help="Path to db_tags.json; the YAML next to it is checked")
+    args = parser.parse_args(argv)
+
+    yaml_path = os.path.splitext(args.db)[0] + ".yaml"
+    try:
+        with open(args.db, "r", encoding="utf-8") as f:
+            tags = json.load(f)["tags"]
+        with open(yaml_path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except FileNotFoundError as e:
+        print(f"Error: File not found at {e.filename}")
+        return 1
+    if text != emit_tags(tags):
+        print(f"{yaml_path} is not what the emitter writes for {args.db} (regenerate it)")
+    problems = yaml_mismatches(text, tags)
+    if problems is None:
+        print("pyyaml is not installed; skipped the re-parse check")
+        return 0
+    for problem in problems[:20]:
+        print(problem)
+    print(f"{yaml_path}: {'OK' if not problems else f'{len(problems)} mismatches'}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())